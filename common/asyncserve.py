@@ -0,0 +1,196 @@
+"""Asyncio (ASGI) serving mode shared by the ``m_dining`` and ``m_proxy`` services.
+
+`AsyncApp` answers the hot POST routes with coroutines. Their blocking calls are
+awaited on a bounded thread pool with `run_blocking`, so a conversation waiting
+on Datastore, MDining or Dialogflow holds no worker, and independent calls can
+run at the same time. Every other path is passed through to the Flask app
+unchanged. Run it with an ASGI server, e.g. ``uvicorn asyncmain:app``.
+"""
+import asyncio
+import contextvars
+import functools
+import io
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException, BadRequest, Unauthorized
+
+DEFAULT_WORKERS = 32
+
+executor = ThreadPoolExecutor(max_workers=int(os.environ.get('ASYNC_WORKERS', DEFAULT_WORKERS)),
+                              thread_name_prefix='async-blocking')
+
+
+def run_blocking(function, *args, **kwargs):
+    """Runs a blocking call on the shared thread pool and returns an awaitable of its result.
+       The call sees the caller's context variables (e.g. the current metrics trace).
+    """
+    context = contextvars.copy_context()
+    loop = asyncio.get_event_loop()
+    return loop.run_in_executor(executor, functools.partial(context.run, function, *args, **kwargs))
+
+
+class AsyncRequest:
+    """Method, path, headers and body of one HTTP request.
+    """
+    __slots__ = ('method', 'path', 'headers', 'body')
+
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                        for name, value in scope.get('headers', ())}
+        self.body = body
+
+    def get_json(self, silent=False):
+        """Returns the decoded JSON body. If it isn't valid JSON, aborts with 400,
+           or returns None when ``silent`` is set.
+        """
+        try:
+            return json.loads(self.body.decode('utf-8'))
+        except ValueError:
+            if silent:
+                return None
+            raise BadRequest('Failed to decode JSON object')
+
+
+def requires_auth(check_authorization):
+    """Decorator for async handlers that aborts with 401 unless
+       ``check_authorization(header)`` accepts the request's Authorization header.
+       The check may load secrets from Datastore, so it runs on the blocking-call pool.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def decorated(request):
+            if not await run_blocking(check_authorization, request.headers.get('authorization', '')):
+                raise Unauthorized()
+            return await handler(request)
+        return decorated
+    return decorator
+
+
+async def read_body(receive):
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+def wsgi_environ(scope, body):
+    """Builds the WSGI environ of an ASGI HTTP request.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {'REQUEST_METHOD': scope['method'],
+               'SCRIPT_NAME': scope.get('root_path', ''),
+               'PATH_INFO': scope['path'],
+               'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+               'SERVER_NAME': server[0],
+               'SERVER_PORT': str(server[1]),
+               'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+               'CONTENT_LENGTH': str(len(body)),
+               'wsgi.version': (1, 0),
+               'wsgi.url_scheme': scope.get('scheme', 'http'),
+               'wsgi.input': io.BytesIO(body),
+               'wsgi.errors': sys.stderr,
+               'wsgi.multithread': True,
+               'wsgi.multiprocess': False,
+               'wsgi.run_once': False}
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else 'HTTP_' + name
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app, scope, body):
+    """Runs a WSGI app for an ASGI HTTP request, returns (status, headers, body).
+    """
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                               for name, value in headers]
+        return chunks.append
+
+    result = wsgi_app(wsgi_environ(scope, body), start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], b''.join(chunks)
+
+
+class AsyncApp:
+    """ASGI application with async handlers for some routes and a WSGI fallback.
+
+    :param wsgi_app: Flask app answering every route without an async handler
+    :type wsgi_app: flask.Flask
+    :param routes: (method, path) -> async handler taking an `AsyncRequest`
+                   and returning JSON-serializable response data
+    :type routes: dict
+    :param response_headers: Function of the `AsyncRequest` returning extra (name, value)
+                             headers for async responses (e.g. CORS)
+    :type response_headers: function
+    """
+    def __init__(self, wsgi_app, routes, response_headers=None):
+        self.wsgi_app = wsgi_app
+        self.routes = dict(routes)
+        self.response_headers = response_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        body = await read_body(receive)
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is None:
+            status, headers, content = await run_blocking(call_wsgi, self.wsgi_app, scope, body)
+        else:
+            request = AsyncRequest(scope, body)
+            status, data = await self.handle(handler, request)
+            content = json.dumps(data, default=str).encode('utf-8')
+            headers = [(b'content-type', b'application/json'),
+                       (b'content-length', str(len(content)).encode('latin-1'))]
+            if self.response_headers is not None:
+                headers.extend((name.lower().encode('latin-1'), value.encode('latin-1'))
+                               for name, value in self.response_headers(request))
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def handle(self, handler, request):
+        """Runs an async handler, returns (status, response data).
+        """
+        try:
+            return 200, await handler(request)
+        except HTTPException as error:
+            return error.code, {'message': error.description}
+        except Exception:
+            traceback.print_exc()
+            return 500, {'message': 'Internal Server Error'}
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
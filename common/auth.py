@@ -0,0 +1,167 @@
+"""HTTP basic authentication shared by the ``m_dining`` and ``m_proxy`` services.
+
+Credentials are checked against the cached secrets with constant-time
+comparison. A verified Authorization header is remembered for ``AUTH_CACHE_TTL``
+seconds, and a rejected one is turned away for ``AUTH_REJECT_TTL`` seconds
+without being compared again. Both caches are dropped when the secrets change.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, abort
+
+from secretstore import get_secrets
+
+DEFAULT_CACHE_TTL = 60
+DEFAULT_REJECT_TTL = 30
+DEFAULT_MAX_ENTRIES = 1024
+
+
+def constant_time_equals(given, expected):
+    """Compares two strings without leaking where they differ through timing.
+    """
+    if given is None or expected is None:
+        return False
+    return hmac.compare_digest(str(given).encode('utf-8'), str(expected).encode('utf-8'))
+
+
+def parse_basic(header):
+    """Returns the (username, password) of a basic Authorization header, or None.
+    """
+    scheme, _, encoded = (header or '').partition(' ')
+    if scheme.lower() != 'basic':
+        return None
+    try:
+        decoded = base64.b64decode(encoded.strip(), validate=True).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    name, sep, passw = decoded.partition(':')
+    if not sep:
+        return None
+    return name, passw
+
+
+class Authenticator:
+    """Verifies basic auth credentials against the secrets with short-lived caches.
+
+    :param secrets_function: Callable returning the secrets mapping
+    :type secrets_function: function
+    :param cache_ttl: Seconds a verified Authorization header is trusted
+    :type cache_ttl: int
+    :param reject_ttl: Seconds a rejected Authorization header is rejected without checking
+    :type reject_ttl: int
+    :param max_entries: Maximum number of headers remembered in each cache
+    :type max_entries: int
+    """
+    def __init__(self, secrets_function, cache_ttl=DEFAULT_CACHE_TTL,
+                 reject_ttl=DEFAULT_REJECT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.secrets_function = secrets_function
+        self.cache_ttl = cache_ttl
+        self.reject_ttl = reject_ttl
+        self.max_entries = max_entries
+        self._accepted = OrderedDict()
+        self._rejected = OrderedDict()
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self._counters = {'accepted': 0, 'accepted_cached': 0, 'rejected': 0,
+                          'rejected_cached': 0, 'missing': 0}
+
+    def check_auth(self, name, passw):
+        """Returns True if ``name``/``passw`` match the user and pass secrets.
+        """
+        secrets = self.secrets_function()
+        user_ok = constant_time_equals(name, secrets.get('user'))
+        pass_ok = constant_time_equals(passw, secrets.get('pass'))
+        return user_ok and pass_ok
+
+    def check_header(self, header, name, passw):
+        """Verifies the credentials of an Authorization header, using the caches.
+
+        :param header: Raw Authorization header, used as the cache key
+        :type header: string
+        """
+        secrets = self.secrets_function()
+        fingerprint = hash((secrets.get('user'), secrets.get('pass')))
+        key = hashlib.sha256(header.encode('utf-8')).digest()
+        now = time.monotonic()
+
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                self._accepted.clear()
+                self._rejected.clear()
+                self._fingerprint = fingerprint
+            if self._accepted.get(key, 0) > now:
+                self._counters['accepted_cached'] += 1
+                return True
+            if self._rejected.get(key, 0) > now:
+                self._counters['rejected_cached'] += 1
+                return False
+
+        valid = self.check_auth(name, passw)
+        with self._lock:
+            if valid:
+                self._remember(self._accepted, key, now + self.cache_ttl)
+                self._counters['accepted'] += 1
+            else:
+                self._remember(self._rejected, key, now + self.reject_ttl)
+                self._counters['rejected'] += 1
+        return valid
+
+    def check_authorization(self, header):
+        """Returns True if a raw Authorization header carries valid basic auth,
+           for callers outside of a Flask request.
+        """
+        credentials = parse_basic(header)
+        if credentials is None:
+            with self._lock:
+                self._counters['missing'] += 1
+            return False
+        return self.check_header(header, *credentials)
+
+    def requires_auth(self, f):
+        """Decorator that aborts with 401 unless the request has valid basic auth.
+        """
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            auth = request.authorization
+            if not auth:
+                with self._lock:
+                    self._counters['missing'] += 1
+                abort(401)
+            if not self.check_header(request.headers.get('Authorization', ''),
+                                     auth.username, auth.password):
+                abort(401)
+            return f(*args, **kwargs)
+        return decorated
+
+    def stats(self):
+        """Returns accept/reject counters, including cache hits.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['accepted_entries'] = len(self._accepted)
+            stats['rejected_entries'] = len(self._rejected)
+        return stats
+
+    def _remember(self, cache, key, expires):
+        cache[key] = expires
+        cache.move_to_end(key)
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+
+
+authenticator = Authenticator(
+    get_secrets,
+    cache_ttl=int(os.environ.get('AUTH_CACHE_TTL', DEFAULT_CACHE_TTL)),
+    reject_ttl=int(os.environ.get('AUTH_REJECT_TTL', DEFAULT_REJECT_TTL)),
+    max_entries=int(os.environ.get('AUTH_CACHE_ENTRIES', DEFAULT_MAX_ENTRIES)))
+
+check_auth = authenticator.check_auth
+requires_auth = authenticator.requires_auth
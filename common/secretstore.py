@@ -0,0 +1,120 @@
+"""Process-wide cache of the ``env_vars`` secrets entity kept in Datastore.
+
+Shared by the ``m_dining`` and ``m_proxy`` services (each service directory links
+to this file). Secrets are loaded once, refreshed in the background every
+``SECRETS_TTL`` seconds, and the last good copy keeps being served if a refresh fails.
+"""
+import logging
+import os
+import threading
+import time
+
+DEFAULT_TTL = 300
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def load_from_datastore():
+    """Fetches the first ``env_vars`` entity from Datastore using a shared client.
+       The Datastore library is imported on first use to keep it out of instance startup.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from google.cloud import datastore
+            _client = datastore.Client()
+        client = _client
+    query = client.query(kind='env_vars')
+    return list(query.fetch(limit=1))[0]
+
+
+class SecretsProvider:
+    """Serves a cached copy of the secrets, refreshing it on a timer.
+
+    :param loader: Callable returning the secrets mapping
+    :type loader: function
+    :param ttl: Seconds between background refreshes
+    :type ttl: int
+    """
+    def __init__(self, loader, ttl=DEFAULT_TTL):
+        self.loader = loader
+        self.ttl = ttl
+        self._secrets = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._counters = {'hits': 0, 'loads': 0, 'refreshes': 0, 'refresh_failures': 0}
+
+    def get(self):
+        """Returns the cached secrets, loading them synchronously on first use.
+        """
+        if self._secrets is None:
+            with self._lock:
+                if self._secrets is None:
+                    self._secrets = self.loader()
+                    self._loaded_at = time.time()
+                    self._counters['loads'] += 1
+        else:
+            self._counters['hits'] += 1
+
+        #Thread is missing after a fork or if it died; restart it
+        if self._thread is None or not self._thread.is_alive():
+            self._start_refresher()
+        return self._secrets
+
+    def refresh(self):
+        """Reloads the secrets, keeping the previous copy if the loader fails.
+        Returns True if the secrets were replaced.
+        """
+        try:
+            secrets = self.loader()
+        except Exception:
+            self._counters['refresh_failures'] += 1
+            logger.exception('Secrets refresh failed, serving copy from %.0fs ago',
+                             time.time() - self._loaded_at)
+            return False
+        with self._lock:
+            self._secrets = secrets
+            self._loaded_at = time.time()
+            self._counters['refreshes'] += 1
+        return True
+
+    def stats(self):
+        """Returns hit/refresh counters and the age of the cached copy in seconds.
+        """
+        stats = dict(self._counters)
+        stats['age'] = time.time() - self._loaded_at if self._secrets is not None else None
+        stats['ttl'] = self.ttl
+        return stats
+
+    def stop(self):
+        """Stops the background refresh thread.
+        """
+        self._stop.set()
+
+    def _start_refresher(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._refresh_loop,
+                                            name='secrets-refresh', daemon=True)
+            self._thread.start()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.ttl):
+            self.refresh()
+
+
+provider = SecretsProvider(load_from_datastore,
+                           ttl=int(os.environ.get('SECRETS_TTL', DEFAULT_TTL)))
+
+
+def get_secrets():
+    """Returns the process-wide cached secrets entity.
+    """
+    return provider.get()
@@ -0,0 +1,113 @@
+"""Instance warmup shared by the ``m_dining`` and ``m_proxy`` services.
+
+Each service lists its warmup steps (load secrets, open connections, prime
+caches) and serves them at ``/_ah/warmup``, which App Engine requests before a
+new instance joins the serving pool. Steps run once per instance, in order, and
+a failing step is reported without stopping the ones after it. Later calls
+return the report of the first run. The route is unauthenticated, so it only
+answers with each step's name and status. What the steps primed and why they
+failed go to the service's reporter.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def log_report(report):
+    """Default reporter, logs the timings of a warmup run and why steps failed.
+
+    :param report: Full warmup report from `Warmup.report`
+    :type report: dict
+    """
+    for step in report['steps']:
+        if not step['ok']:
+            logger.warning('Warmup step %s failed: %s', step['name'], step['error'])
+    logger.info('Warmup finished in %.1f ms: %s', report['ms'],
+                ', '.join('%s %.1f ms' % (step['name'], step['ms']) for step in report['steps']))
+
+
+def summary(report):
+    """Returns the part of a warmup report that is safe to answer with: whether
+       the run and each step succeeded.
+    """
+    return {'ok': report['ok'],
+            'steps': [{'name': step['name'], 'ok': step['ok']} for step in report['steps']]}
+
+
+class Warmup:
+    """Ordered set of named warmup steps, run once per instance.
+
+    :param reporter: Called once with the full report of the first run, defaults to `log_report`
+    :type reporter: function
+    """
+    def __init__(self, reporter=log_report):
+        self.steps = []
+        self.reporter = reporter
+        self._report = None
+        self._lock = threading.Lock()
+
+    def step(self, name):
+        """Decorator registering a function as the next warmup step. The function's
+           return value is reported as what the step primed.
+
+        :param name: Step name used in the report
+        :type name: string
+        """
+        def decorator(function):
+            self.steps.append((name, function))
+            return function
+        return decorator
+
+    def run(self):
+        """Runs every step on the first call, hands the full report to the reporter and
+           returns its `summary`: ``{"ok", "steps": [{"name", "ok"}]}``.
+           Concurrent and later calls wait for and return the same summary.
+        """
+        return summary(self.report())
+
+    def report(self):
+        """Runs every step on the first call and returns the full report:
+           ``{"ok", "ms", "steps": [{"name", "ok", "ms", "primed" or "error"}]}``.
+        """
+        with self._lock:
+            if self._report is None:
+                self._report = self._run_steps()
+                try:
+                    self.reporter(self._report)
+                except Exception:
+                    logger.exception('Warmup reporter failed')
+            return self._report
+
+    def stats(self):
+        """Returns whether warmup ran, its duration and the number of failed steps.
+        """
+        report = self._report
+        if report is None:
+            return {'done': 0, 'ms': 0.0, 'failed_steps': 0}
+        return {'done': 1,
+                'ms': report['ms'],
+                'failed_steps': sum(1 for step in report['steps'] if not step['ok'])}
+
+    def _run_steps(self):
+        start = time.monotonic()
+        steps = []
+        for name, function in self.steps:
+            step_start = time.monotonic()
+            entry = {'name': name}
+            try:
+                entry['primed'] = function()
+                entry['ok'] = True
+            except Exception as error:
+                entry['ok'] = False
+                entry['error'] = repr(error)
+            entry['ms'] = round(1000 * (time.monotonic() - step_start), 1)
+            steps.append(entry)
+
+        return {'ok': all(step['ok'] for step in steps),
+                'ms': round(1000 * (time.monotonic() - start), 1),
+                'steps': steps}
+
+
+warmup = Warmup()
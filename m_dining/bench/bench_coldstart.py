@@ -0,0 +1,232 @@
+"""Cold-start budget report for the m_dining and m_proxy services.
+
+Starts each service in a fresh interpreter with ``-X importtime``, times
+``import main`` and the first request to ``/`` or to the webhook, and breaks the
+import cost down by top-level package: what every instance pays at startup,
+and what is deferred to the first request by lazy imports. Outbound services are
+local fakes, but the first call to each fake still imports the library it stands
+in for, as the real lazy code path does. Exits with status 1 if any scenario's
+import plus first response takes longer than the budget.
+
+Usage::
+
+    python m_dining/bench/bench_coldstart.py --budget-ms 1500
+    python m_dining/bench/bench_coldstart.py --runs 5 --json
+"""
+import argparse
+import base64
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIRS = {'m_dining': os.path.join(os.path.dirname(BENCH_DIR), 'flask'),
+                'm_proxy': os.path.join(os.path.dirname(os.path.dirname(BENCH_DIR)), 'm_proxy', 'flask')}
+SCENARIOS = (('m_dining', '/'), ('m_dining', '/webhook'), ('m_proxy', '/'), ('m_proxy', '/proxy'))
+
+DEFAULT_BUDGET_MS = 1500.0
+
+#Written to stderr between the phases of a child so its importtime lines can be attributed
+MARKER = 'coldstart:'
+
+
+def importing(module, function):
+    """Wraps a fake so that its first call also imports the library it replaces.
+    """
+    def call(*args, **kwargs):
+        importlib.import_module(module)
+        return function(*args, **kwargs)
+    return call
+
+
+class FakeSessionsClient:
+    """Dialogflow ``SessionsClient`` answering every query after a fixed latency.
+    """
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def session_path(self, project, session_id):
+        return 'projects/%s/agent/sessions/%s' % (project, session_id)
+
+    def detect_intent(self, session, query_input, timeout=None):
+        if self.latency:
+            time.sleep(self.latency)
+        result = type('QueryResult', (), {'fulfillment_text': 'Success'})
+        return type('DetectIntentResponse', (), {'query_result': result})
+
+
+def first_request(service, path, args):
+    """Replaces the outbound services of the already imported service with fakes,
+       returns a function sending the first request to ``path``.
+    """
+    import fakes
+    import main
+    import secretstore
+
+    token = base64.b64encode(('%s:%s' % (fakes.SECRETS['user'], fakes.SECRETS['pass'])).encode())
+    headers = {'Authorization': 'Basic ' + token.decode()}
+    client = main.app.test_client()
+    datastore = fakes.FakeDatastore(args.datastore_latency / 1000)
+
+    if service == 'm_dining':
+        installed = fakes.install(mdining_latency=args.mdining_latency / 1000,
+                                  dashbot_latency=args.dashbot_latency / 1000)
+        import analytics
+        analytics.analytics.client_factory = importing('dashbot.google', installed['dashbot'])
+        payload = fakes.load_fixture('webhook', args.fixture + '.json')
+    else:
+        import dialogflowclient
+        dialogflowclient.sessions.client_factory = importing(
+            'dialogflow_v2', lambda: FakeSessionsClient(args.dialogflow_latency / 1000))
+        payload = {'project': 'bench', 'user_query': 'What is for dinner at Mosher Jordan?'}
+    secretstore.provider.loader = importing('google.cloud.datastore', datastore)
+
+    if path == '/':
+        return lambda: client.get('/')
+    return lambda: client.post(path, json=payload, headers=headers)
+
+
+def child(args):
+    """Runs one scenario in this (fresh) interpreter and prints its timings as JSON.
+    """
+    service_dir = SERVICE_DIRS[args.child]
+    sys.path[:0] = [service_dir, BENCH_DIR]
+    os.chdir(service_dir)
+
+    sys.stderr.write(MARKER + ' start\n')
+    start = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    sys.stderr.write(MARKER + ' imported\n')
+
+    send = first_request(args.child, args.path, args)
+    sys.stderr.write(MARKER + ' fakes installed\n')
+    request_start = time.perf_counter()
+    response = send()
+    answered = time.perf_counter()
+    sys.stderr.write(MARKER + ' answered\n')
+
+    if response.status_code != 200:
+        raise RuntimeError('%s returned %d: %s' % (args.path, response.status_code,
+                                                   response.get_data(as_text=True)))
+    print(json.dumps({'import_ms': 1000 * (imported - start),
+                      'request_ms': 1000 * (answered - request_start)}))
+
+
+def parse_importtime(lines):
+    """Splits a child's ``-X importtime`` output at its markers, returns
+       ({package: self microseconds} at import, {package: self microseconds} at first request).
+       Imports of the interpreter, the benchmark and the fakes are left out.
+    """
+    startup = {}
+    deferred = {}
+    phases = [None, startup, None, deferred, None]
+    phase = 0
+    for line in lines:
+        if line.startswith(MARKER):
+            phase += 1
+            continue
+        if phases[phase] is None or not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        phases[phase][package] = phases[phase].get(package, 0) + int(self_us)
+    return startup, deferred
+
+
+def run_scenario(service, path, args):
+    """Runs a scenario ``args.runs`` times, each in a fresh interpreter.
+    """
+    command = [sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--child', service, '--path', path,
+               '--fixture', args.fixture, '--mdining-latency', str(args.mdining_latency),
+               '--datastore-latency', str(args.datastore_latency), '--dashbot-latency', str(args.dashbot_latency),
+               '--dialogflow-latency', str(args.dialogflow_latency)]
+    timings = []
+    startup = deferred = None
+    for _ in range(args.runs):
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        if result.returncode:
+            raise RuntimeError('%s %s failed:\n%s' % (service, path, result.stderr[-2000:]))
+        timings.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        if startup is None:
+            startup, deferred = parse_importtime(result.stderr.splitlines())
+
+    total_ms = statistics.median(timing['import_ms'] + timing['request_ms'] for timing in timings)
+    return {'service': service,
+            'path': path,
+            'import_ms': statistics.median(timing['import_ms'] for timing in timings),
+            'request_ms': statistics.median(timing['request_ms'] for timing in timings),
+            'total_ms': total_ms,
+            'within_budget': total_ms <= args.budget_ms,
+            'startup_imports': top_packages(startup, args.top),
+            'first_request_imports': top_packages(deferred, args.top)}
+
+
+def top_packages(costs, limit):
+    """Returns the ``limit`` most expensive packages as [package, milliseconds] pairs.
+    """
+    ordered = sorted(costs.items(), key=lambda cost: cost[1], reverse=True)
+    return [[package, self_us / 1000] for package, self_us in ordered[:limit]]
+
+
+def run(args):
+    results = [run_scenario(service, path, args) for service, path in SCENARIOS]
+    return {'budget_ms': args.budget_ms,
+            'runs': args.runs,
+            'results': results,
+            'within_budget': all(result['within_budget'] for result in results)}
+
+
+def print_report(report):
+    print('cold-start budget %.0f ms, median of %d fresh interpreters\n' % (report['budget_ms'], report['runs']))
+    print('%-10s %-10s %10s %10s %10s %8s' % ('service', 'path', 'import ms', 'first ms', 'total ms', 'budget'))
+    for result in report['results']:
+        print('%-10s %-10s %10.1f %10.1f %10.1f %8s' % (result['service'], result['path'], result['import_ms'],
+                                                        result['request_ms'], result['total_ms'],
+                                                        'ok' if result['within_budget'] else 'OVER'))
+    for result in report['results']:
+        print('\n%s %s' % (result['service'], result['path']))
+        for label, costs in (('  at import:', result['startup_imports']),
+                             ('  at first request:', result['first_request_imports'])):
+            print(label)
+            if not costs:
+                print('    (none)')
+            for package, cost in costs:
+                print('    %-30s %8.1f ms' % (package, cost))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help='allowed import plus first response time per scenario')
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters per scenario')
+    parser.add_argument('--top', type=int, default=8, help='packages listed per import phase')
+    parser.add_argument('--fixture', default='findLocationAndMeal', help='webhook fixture for the first /webhook')
+    parser.add_argument('--mdining-latency', type=float, default=50.0, help='fake MDining API latency in ms')
+    parser.add_argument('--datastore-latency', type=float, default=30.0, help='fake Datastore latency in ms')
+    parser.add_argument('--dashbot-latency', type=float, default=40.0, help='fake Dashbot latency in ms')
+    parser.add_argument('--dialogflow-latency', type=float, default=150.0, help='fake Dialogflow latency in ms')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--child', choices=sorted(SERVICE_DIRS), help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print_report(report)
+    sys.exit(0 if report['within_budget'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Menu parsing benchmark: full ``.json()`` loading against streaming parsing.
+
+Synthesizes large whole-day menus, splits each response body into network-sized
+chunks (optionally delivered at a limited bandwidth), and compares, per menu:
+
+* ``json``: wait for the whole body, ``json.loads`` it, then build the menu model
+* ``stream``: `menustream.parse_menu_stream` over the chunks as they arrive
+* ``stream_first_meal``: streaming with early exit after the first meal
+
+reporting median time-to-menu, peak traced memory and bytes read.
+
+Usage::
+
+    python m_dining/bench/bench_parse.py --courses 40 --items 30
+    python m_dining/bench/bench_parse.py --bandwidth 2 --json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import menusynth
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'flask'))
+
+from menumodel import parse_menu
+from menustream import parse_menu_stream, DEFAULT_CHUNK_SIZE
+
+
+def deliver(body, chunk_size, bandwidth):
+    """Yields ``body`` in chunks, sleeping to simulate ``bandwidth`` bytes/second (0: no delay).
+    """
+    for start in range(0, len(body), chunk_size):
+        chunk = body[start:start + chunk_size]
+        if bandwidth:
+            time.sleep(len(chunk) / bandwidth)
+        yield chunk
+
+
+def load_json(chunks):
+    body = b''.join(chunks)
+    return parse_menu(json.loads(body.decode('utf-8'))), len(body)
+
+
+def load_stream(chunks):
+    return parse_menu_stream(chunks)
+
+
+def make_first_meal_loader(meal_in):
+    def load_first_meal(chunks):
+        return parse_menu_stream(chunks, meal_in)
+    return load_first_meal
+
+
+def measure(loader, body, args):
+    """Returns (seconds, peak traced bytes, bytes read) of one parse of ``body``.
+    """
+    start = time.perf_counter()
+    menu, size = loader(deliver(body, args.chunk_size, args.bandwidth))
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    loader(deliver(body, args.chunk_size, 0))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def run(args):
+    bodies = []
+    for number in range(args.menus):
+        day = menusynth.make_day('Synthetic Dining Hall %03d' % number, '2019-11-12',
+                                 args.meals, args.courses, args.items, args.seed)
+        bodies.append(json.dumps(day).encode('utf-8'))
+
+    results = []
+    for name in ('json', 'stream', 'stream_first_meal'):
+        times = []
+        peaks = []
+        sizes = []
+        for body in bodies:
+            loader = {'json': load_json, 'stream': load_stream}.get(name)
+            if loader is None:
+                loader = make_first_meal_loader(parse_menu(json.loads(body.decode('utf-8'))).meals[0].name)
+            for _ in range(args.repeat):
+                elapsed, peak, size = measure(loader, body, args)
+                times.append(elapsed)
+                peaks.append(peak)
+                sizes.append(size)
+        results.append({'name': name,
+                        'median_ms': 1000 * statistics.median(times),
+                        'max_ms': 1000 * max(times),
+                        'peak_kb': statistics.median(peaks) / 1024,
+                        'read_kb': statistics.median(sizes) / 1024})
+
+    return {'menus': len(bodies),
+            'body_kb': statistics.median(len(body) for body in bodies) / 1024,
+            'results': results}
+
+
+def print_report(report):
+    print('%d menus, median body %.0f KB\n' % (report['menus'], report['body_kb']))
+    print('%-20s %10s %10s %10s %10s' % ('parser', 'median ms', 'max ms', 'peak KB', 'read KB'))
+    for result in report['results']:
+        print('%-20s %10.2f %10.2f %10.0f %10.0f' % (result['name'], result['median_ms'], result['max_ms'],
+                                                   result['peak_kb'], result['read_kb']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--menus', type=int, default=10, help='number of synthetic menus')
+    parser.add_argument('--meals', type=int, default=4, help='maximum meals per day')
+    parser.add_argument('--courses', type=int, default=40, help='maximum courses per meal')
+    parser.add_argument('--items', type=int, default=30, help='maximum items per course')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='timed parses per menu and parser')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='bytes per network chunk')
+    parser.add_argument('--bandwidth', type=float, default=0.0, help='simulated MB/s, 0 for no transfer delay')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+    args.bandwidth *= 1024 * 1024
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""End-to-end webhook benchmark.
+
+Drives the m_dining Flask ``app`` through its test client with recorded
+Dialogflow webhook payloads (``fixtures/webhook``), with Datastore, Stackdriver,
+Dashbot and the MDining API replaced by local fakes, and reports per-intent
+p50/p95/p99 latency and requests per second.
+
+Usage::
+
+    python m_dining/bench/bench_webhook.py --requests 500 --mdining-latency 80
+    python m_dining/bench/bench_webhook.py --cold --json
+"""
+import argparse
+import base64
+import glob
+import json
+import os
+import time
+
+import fakes
+
+
+def percentile(ordered, fraction):
+    """Returns the nearest-rank percentile of an already sorted list.
+    """
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def load_payloads(pattern):
+    """Returns ``{fixture name: webhook payload}`` for fixtures matching ``pattern``.
+    """
+    payloads = {}
+    for path in sorted(glob.glob(os.path.join(fakes.FIXTURES_DIR, 'webhook', pattern + '.json'))):
+        with open(path) as file:
+            payloads[os.path.basename(path)[:-5]] = json.load(file)
+    return payloads
+
+
+def summarize(name, latencies, elapsed):
+    ordered = sorted(latencies)
+    return {'name': name,
+            'requests': len(ordered),
+            'rps': len(ordered) / elapsed if elapsed else 0.0,
+            'p50_ms': 1000 * percentile(ordered, 0.50),
+            'p95_ms': 1000 * percentile(ordered, 0.95),
+            'p99_ms': 1000 * percentile(ordered, 0.99)}
+
+
+def run(args):
+    installed = fakes.install(mdining_latency=args.mdining_latency / 1000,
+                              datastore_latency=args.datastore_latency / 1000,
+                              dashbot_latency=args.dashbot_latency / 1000,
+                              logging_latency=args.logging_latency / 1000)
+
+    import main
+    from menucache import menu_cache
+
+    client = main.app.test_client()
+    token = base64.b64encode(('%s:%s' % (fakes.SECRETS['user'], fakes.SECRETS['pass'])).encode())
+    headers = {'Authorization': 'Basic ' + token.decode()}
+
+    results = []
+    for name, payload in load_payloads(args.intents).items():
+        for _ in range(args.warmup):
+            client.post('/webhook', json=payload, headers=headers)
+
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            if args.cold:
+                menu_cache.clear()
+            request_start = time.perf_counter()
+            response = client.post('/webhook', json=payload, headers=headers)
+            latencies.append(time.perf_counter() - request_start)
+            if response.status_code != 200:
+                raise RuntimeError('%s returned %d: %s' % (name, response.status_code,
+                                                           response.get_data(as_text=True)))
+        results.append(summarize(name, latencies, time.perf_counter() - start))
+
+    return {'results': results,
+            'upstream_requests': installed['mdining'].requests,
+            'menu_cache': menu_cache.stats()}
+
+
+def print_report(report):
+    print('%-34s %8s %9s %9s %9s %9s' % ('fixture', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for result in report['results']:
+        print('%-34s %8d %9.1f %9.3f %9.3f %9.3f' % (result['name'], result['requests'], result['rps'],
+                                                     result['p50_ms'], result['p95_ms'], result['p99_ms']))
+    print('\nupstream MDining requests: %d' % report['upstream_requests'])
+    print('menu cache: %s' % json.dumps(report['menu_cache'], sort_keys=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per fixture')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed requests per fixture')
+    parser.add_argument('--intents', default='*', help='glob of webhook fixture names to run')
+    parser.add_argument('--cold', action='store_true', help='clear the menu cache before every request')
+    parser.add_argument('--mdining-latency', type=float, default=50.0, help='fake MDining API latency in ms')
+    parser.add_argument('--datastore-latency', type=float, default=30.0, help='fake Datastore latency in ms')
+    parser.add_argument('--dashbot-latency', type=float, default=40.0, help='fake Dashbot latency in ms')
+    parser.add_argument('--logging-latency', type=float, default=20.0, help='fake Stackdriver latency in ms')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
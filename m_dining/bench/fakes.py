@@ -0,0 +1,165 @@
+"""Local stand-ins for the Google services and the MDining API used by the webhook.
+
+Each fake sleeps for a configurable latency so that benchmarks can model the
+cost of the real network calls without leaving the process.
+"""
+import json
+import os
+import sys
+import time
+from urllib.parse import urlsplit, parse_qs
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FLASK_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'flask')
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+
+FAKE_HOST = 'mdining.bench'
+SECRETS = {'user': 'bench',
+           'pass': 'bench',
+           'dashbot_api': 'bench-dashbot-key',
+           'slack_api': 'http://%s/slack' % FAKE_HOST,
+           'm_dining_api_main': 'http://%s/menu/xml2print.php?controller=&view=json' % FAKE_HOST,
+           'm_dining_api_meals': 'http://%s/menu/meals' % FAKE_HOST,
+           'm_dining_api_locations': 'http://%s/menu/locations' % FAKE_HOST}
+
+
+def load_fixture(*path):
+    """Loads a JSON fixture relative to ``fixtures/``.
+    """
+    with open(os.path.join(FIXTURES_DIR, *path)) as file:
+        return json.load(file)
+
+
+def meal_menu(day, meal_in):
+    """Returns the single-meal response shape the API sends when ``&meal=`` is set.
+
+    :param day: Whole-day MDining API response
+    :type day: dict
+    :param meal_in: Requested meal
+    :type meal_in: string
+    """
+    meals = day['menu'].get('meal', [])
+    if isinstance(meals, dict):
+        meals = [meals]
+    for meal in meals:
+        if meal['name'].upper() == meal_in.upper():
+            return {'menu': dict(day['menu'], meal=meal)}
+    return {'menu': dict(day['menu'], meal={'name': meal_in.upper()})}
+
+
+class FakeMDiningAdapter(BaseAdapter):
+    """Transport adapter answering MDining API urls from fixtures.
+
+    :param latency: Seconds to sleep per request
+    :type latency: float
+    """
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.day = load_fixture('mdining', 'menu_day.json')
+        self.options = {'/menu/meals': load_fixture('mdining', 'meals.json'),
+                        '/menu/locations': load_fixture('mdining', 'locations.json'),
+                        '/slack': {'ok': True}}
+        self.requests = 0
+
+    def send(self, request, **kwargs):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlsplit(request.url)
+        if url.path in self.options:
+            body = self.options[url.path]
+        else:
+            meal_in = parse_qs(url.query).get('meal', [''])[0]
+            body = meal_menu(self.day, meal_in) if meal_in else self.day
+
+        response = Response()
+        response.status_code = 200
+        response._content = json.dumps(body).encode('utf-8')
+        response._content_consumed = True
+        response.headers['Content-Type'] = 'application/json'
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeDatastore:
+    """Secrets loader standing in for the Datastore ``env_vars`` query.
+    """
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.loads = 0
+
+    def __call__(self):
+        self.loads += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return dict(SECRETS)
+
+
+class FakeDashbot:
+    """Dashbot client factory whose clients sleep instead of posting.
+    """
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.events = 0
+
+    def __call__(self, api_key):
+        return self
+
+    def logIncoming(self, data):
+        self._log()
+
+    def logOutgoing(self, data, response):
+        self._log()
+
+    def _log(self):
+        self.events += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class FakeLogSink:
+    """Event log sink standing in for Stackdriver.
+    """
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.records = []
+
+    def write(self, records):
+        if self.latency:
+            time.sleep(self.latency)
+        self.records.extend(records)
+
+
+def install(mdining_latency=0.0, datastore_latency=0.0, dashbot_latency=0.0,
+            logging_latency=0.0):
+    """Puts the m_dining flask app on the import path and replaces its outbound
+       services with fakes. Returns the fakes keyed by service name.
+    """
+    if FLASK_DIR not in sys.path:
+        sys.path.insert(0, FLASK_DIR)
+    os.chdir(FLASK_DIR)
+
+    import analytics
+    import eventlog
+    import httpclient
+    import secretstore
+
+    fakes = {'mdining': FakeMDiningAdapter(mdining_latency),
+             'datastore': FakeDatastore(datastore_latency),
+             'dashbot': FakeDashbot(dashbot_latency),
+             'logging': FakeLogSink(logging_latency)}
+    httpclient.http.session.mount('http://', fakes['mdining'])
+    httpclient.http.session.mount('https://', fakes['mdining'])
+    secretstore.provider.loader = fakes['datastore']
+    analytics.analytics.client_factory = fakes['dashbot']
+    eventlog.event_log.sink = fakes['logging']
+    return fakes
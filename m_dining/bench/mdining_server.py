@@ -0,0 +1,189 @@
+"""Local stand-in for the MDining API.
+
+Serves ``xml2print.php?view=json`` menus (whole day, or one meal with ``&meal=``)
+and the meal/location option-list endpoints, from the recorded fixture or from
+synthesized data at any scale, with configurable latency, error rate and
+slow-drip responses.
+
+Point the webhook at it through the Datastore secrets::
+
+    m_dining_api_main      = http://localhost:8081/menu/xml2print.php?controller=&view=json
+    m_dining_api_meals     = http://localhost:8081/menu/meals
+    m_dining_api_locations = http://localhost:8081/menu/locations
+
+Usage::
+
+    python m_dining/bench/mdining_server.py --synthesize --locations 500 --items 20
+    python m_dining/bench/mdining_server.py --latency 200 --jitter 100 --error-rate 0.05
+    python m_dining/bench/mdining_server.py --drip-bytes 256 --drip-interval 50
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import fakes
+import menusynth
+
+
+class MenuSource:
+    """Builds menu and option-list responses from fixtures or synthesized data.
+    """
+    def __init__(self, synthesize=False, locations=None, meals=3, courses=6, items=8, seed=0):
+        self.synthesize = synthesize
+        self.meals = meals
+        self.courses = courses
+        self.items = items
+        self.seed = seed
+        self.fixture = fakes.load_fixture('mdining', 'menu_day.json')
+        base_locations = [entry['optionValue'] for entry in fakes.load_fixture('mdining', 'locations.json')
+                          if entry['optionValue']]
+        self.locations = menusynth.location_names(locations or len(base_locations), base_locations)
+        self.meal_names = [entry['optionValue'] for entry in fakes.load_fixture('mdining', 'meals.json')
+                           if entry['optionValue']]
+        self.day = lru_cache(maxsize=4096)(self._day)
+
+    def _day(self, location, date):
+        if self.synthesize:
+            return menusynth.make_day(location, date, self.meals, self.courses, self.items, self.seed)
+        return {'menu': dict(self.fixture['menu'], name=location, date=date)}
+
+    def menu(self, query):
+        location = query.get('location', [''])[0]
+        date = query.get('date', [''])[0]
+        meal = query.get('meal', [''])[0]
+        day = self.day(location, date)
+        return fakes.meal_menu(day, meal) if meal else day
+
+    def options(self, path):
+        if path.endswith('/meals'):
+            return menusynth.option_list(self.meal_names)
+        return menusynth.option_list(self.locations)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """HTTP server holding the stand-in configuration and request counters.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, source, latency=0.0, jitter=0.0, error_rate=0.0,
+                 hang_rate=0.0, drip_bytes=0, drip_interval=0.0):
+        super().__init__(address, StandInHandler)
+        self.source = source
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.drip_bytes = drip_bytes
+        self.drip_interval = drip_interval
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'errors': 0, 'hangs': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.respond()
+
+    def respond(self):
+        server = self.server
+        url = urlsplit(self.path)
+        if url.path == '/stats':
+            return self.send_body(200, dict(server.counters, menus_cached=server.source.day.cache_info()._asdict()))
+        server.count('requests')
+
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+        if random.random() < server.hang_rate:
+            server.count('hangs')
+            time.sleep(3600)
+            return
+        if random.random() < server.error_rate:
+            server.count('errors')
+            return self.send_body(random.choice((500, 502, 503)), {'error': 'stand-in failure'})
+
+        if url.path.endswith('xml2print.php'):
+            body = server.source.menu(parse_qs(url.query, keep_blank_values=True))
+        elif url.path.endswith(('/meals', '/locations')):
+            body = server.source.options(url.path)
+        else:
+            return self.send_body(404, {'error': 'not found'})
+        self.send_body(200, body)
+
+    def send_body(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+
+        drip_bytes = self.server.drip_bytes
+        if not drip_bytes:
+            self.wfile.write(data)
+            return
+        for start in range(0, len(data), drip_bytes):
+            self.wfile.write(data[start:start + drip_bytes])
+            self.wfile.flush()
+            time.sleep(self.server.drip_interval)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host='127.0.0.1', port=8081, **options):
+    """Builds a `StandInServer`. Options are the `MenuSource` and server keyword arguments.
+    """
+    source_keys = ('synthesize', 'locations', 'meals', 'courses', 'items', 'seed')
+    source = MenuSource(**{key: options.pop(key) for key in source_keys if key in options})
+    return StandInServer((host, port), source, **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--synthesize', action='store_true', help='generate menus instead of using the fixture')
+    parser.add_argument('--locations', type=int, default=0, help='number of locations (default: LocationMain list)')
+    parser.add_argument('--meals', type=int, default=3, help='maximum meals per day')
+    parser.add_argument('--courses', type=int, default=6, help='maximum courses per meal')
+    parser.add_argument('--items', type=int, default=8, help='maximum items per course')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help='base latency in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra uniform random latency in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of 5xx responses')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='fraction of requests that never answer')
+    parser.add_argument('--drip-bytes', type=int, default=0, help='send bodies in chunks of this many bytes')
+    parser.add_argument('--drip-interval', type=float, default=0.0, help='ms between dripped chunks')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, synthesize=args.synthesize,
+                         locations=args.locations or None, meals=args.meals, courses=args.courses,
+                         items=args.items, seed=args.seed, latency=args.latency / 1000,
+                         jitter=args.jitter / 1000, error_rate=args.error_rate,
+                         hang_rate=args.hang_rate, drip_bytes=args.drip_bytes,
+                         drip_interval=args.drip_interval / 1000)
+    print('MDining stand-in listening on http://%s:%d' % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
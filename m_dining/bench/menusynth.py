@@ -0,0 +1,87 @@
+"""Synthetic MDining API menus for load and failure testing.
+
+Menus are generated deterministically from (location, date) so repeated
+requests see the same data. As the real API does when converting its XML,
+a meal/course/menuitem that would hold a single element is sent as a dict
+instead of a one-element list.
+"""
+import random
+import zlib
+
+MEALS = ('BREAKFAST', 'LUNCH', 'DINNER', 'LATE NIGHT')
+COURSES = ('Signature Maize', 'Wild Fire Maize', 'Halal', 'Two Oceans', 'Soup', 'Deli',
+           'Pizza', 'Desserts', 'Bakery', 'Breakfast Entree', 'Hot Cereal', 'Salad Bar')
+WORDS = ('Cheese', 'Pizza', 'Chicken', 'Wings', 'Garden', 'Salad', 'Tomato', 'Soup', 'Tofu',
+         'Scramble', 'Basmati', 'Rice', 'Black', 'Beans', 'Pulled', 'Pork', 'Roasted',
+         'Potatoes', 'Steamed', 'Broccoli', 'Vegetable', 'Sushi', 'Roll', 'Cookie', 'Muffin',
+         'Pancakes', 'Sausage', 'Shawarma', 'Falafel', 'Curry', 'Noodles', 'Burger')
+TRAITS = ('vegan', 'vegetarian', 'mhealthy', 'halal', 'kosher', 'gluten-free')
+ALLERGENS = ('eggs', 'milk', 'fish', 'shellfish', 'peanuts', 'tree-nuts', 'soy',
+             'wheat_barley_rye', 'sesame-seed', 'pork', 'gluten', 'oats')
+
+
+def collapse(values):
+    """Returns a single value as a dict and anything else as a list, like the API.
+    """
+    if len(values) == 1:
+        return values[0]
+    return values
+
+
+def location_names(count, base=()):
+    """Returns ``count`` location names, starting with the names in ``base``.
+    """
+    names = list(base)[:count]
+    names += ['Synthetic Dining Hall %03d' % number for number in range(len(names), count)]
+    return names
+
+
+def make_item(rng):
+    item = {'name': ' '.join(rng.sample(WORDS, rng.randint(1, 3))) + rng.choice(('', ' ')),
+            'serving_size': '1 serving',
+            'nutrition': {'kcal': rng.randint(20, 900)}}
+    traits = rng.sample(TRAITS, rng.randint(0, 3))
+    allergens = rng.sample(ALLERGENS, rng.randint(0, 4))
+    if traits:
+        item['trait'] = {trait: {'name': trait} for trait in traits}
+    if allergens:
+        item['allergens'] = {allergen: {'name': allergen} for allergen in allergens}
+    return item
+
+
+def make_day(location, date, meals=3, courses=6, items=8, seed=0):
+    """Returns a whole-day menu response for a location and date.
+
+    :param location: Location name
+    :type location: string
+    :param date: Date of the menu
+    :type date: string
+    :param meals: Maximum number of meals
+    :type meals: int
+    :param courses: Maximum number of courses per meal
+    :type courses: int
+    :param items: Maximum number of items per course
+    :type items: int
+    :param seed: Extra seed mixed into the per-location random generator
+    :type seed: int
+    """
+    rng = random.Random(zlib.crc32(('%s|%s|%d' % (location, date, seed)).encode()))
+    meal_list = []
+    for meal_name in MEALS[:rng.randint(1, max(1, min(meals, len(MEALS))))]:
+        course_list = []
+        for number in range(rng.randint(1, courses)):
+            course_name = COURSES[number % len(COURSES)]
+            if number >= len(COURSES):
+                course_name += ' %d' % (number // len(COURSES) + 1)
+            course_list.append({'name': course_name,
+                                'menuitem': collapse([make_item(rng)
+                                                      for _ in range(rng.randint(1, items))])})
+        meal_list.append({'name': meal_name, 'course': collapse(course_list)})
+    return {'menu': {'name': location, 'date': str(date), 'meal': collapse(meal_list)}}
+
+
+def option_list(names):
+    """Returns an option-list endpoint response (as used for meals and locations).
+    """
+    return [{'optionValue': '', 'optionText': 'Select'}] + \
+        [{'optionValue': name, 'optionText': name} for name in names]
@@ -0,0 +1,184 @@
+"""Dashbot analytics shipped off the webhook critical path.
+
+Events are pushed onto a bounded in-process queue and a background worker
+drains them in batches through one Dashbot client per API key. When the queue
+is full the configured drop policy decides whether the newest or the oldest
+event is discarded. Pending events are flushed at interpreter shutdown.
+Request data is copied when an event is queued, so the worker sends what the
+user sent even if the webhook changes the request while handling it.
+"""
+import atexit
+import copy
+import os
+import queue
+import threading
+
+from datahandle import report_error
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_FLUSH_TIMEOUT = 5.0
+
+DROP_NEWEST = 'newest'
+DROP_OLDEST = 'oldest'
+
+
+def dashbot_client(api_key):
+    """Builds a Dashbot Google client, importing the Dashbot library on first use.
+    """
+    from dashbot import google as dashbotgoogle
+    return dashbotgoogle.google(api_key)
+
+
+class AnalyticsQueue:
+    """Bounded queue of Dashbot events with a batching background sender.
+
+    :param maxsize: Maximum number of pending events
+    :type maxsize: int
+    :param batch_size: Maximum number of events sent per worker wakeup
+    :type batch_size: int
+    :param drop_policy: Event discarded when the queue is full ('newest'/'oldest')
+    :type drop_policy: string
+    :param client_factory: Callable building a Dashbot client from an API key
+    :type client_factory: function
+    """
+    def __init__(self, maxsize=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                 drop_policy=DROP_NEWEST, client_factory=dashbot_client):
+        self.batch_size = batch_size
+        self.drop_policy = drop_policy
+        self.client_factory = client_factory
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._counters = {'enqueued': 0, 'sent': 0, 'dropped': 0, 'failed': 0, 'batches': 0}
+
+    def log_incoming(self, api_key, req_data):
+        """Queues a Dashbot ``logIncoming`` event with a copy of the request data.
+        """
+        return self.submit(('logIncoming', api_key, (copy.deepcopy(req_data),)))
+
+    def log_outgoing(self, api_key, req_data, responsedata):
+        """Queues a Dashbot ``logOutgoing`` event with copies of the request and response data.
+        """
+        return self.submit(('logOutgoing', api_key, (copy.deepcopy(req_data), copy.deepcopy(responsedata))))
+
+    def submit(self, event):
+        """Adds an event to the queue without blocking,
+           returns False if the event itself was dropped.
+        """
+        if self._closed:
+            self._count('dropped')
+            return False
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            if self.drop_policy != DROP_OLDEST:
+                self._count('dropped')
+                return False
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self._count('dropped')
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                self._count('dropped')
+                return False
+        self._count('enqueued')
+        return True
+
+    def flush(self, timeout=DEFAULT_FLUSH_TIMEOUT):
+        """Waits up to ``timeout`` seconds for pending events to be sent,
+           returns True if the queue drained.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            while not self._queue.empty():
+                self._drain(block=False)
+            return True
+        done = threading.Event()
+
+        def wait():
+            self._queue.join()
+            done.set()
+        threading.Thread(target=wait, daemon=True).start()
+        return done.wait(timeout)
+
+    def close(self, timeout=DEFAULT_FLUSH_TIMEOUT):
+        """Stops accepting events and flushes the ones already queued.
+        """
+        self._closed = True
+        return self.flush(timeout)
+
+    def prepare(self, api_key):
+        """Builds the Dashbot client for ``api_key`` ahead of the first event.
+        """
+        if api_key:
+            self._client(api_key)
+
+    def stats(self):
+        """Returns queue depth and enqueued/sent/dropped/failed counters.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+        stats['depth'] = self._queue.qsize()
+        return stats
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='analytics-sender',
+                                                daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._drain(block=True)
+
+    def _drain(self, block):
+        batch = []
+        try:
+            batch.append(self._queue.get(block=block))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not batch:
+            return
+
+        failed = 0
+        for method, api_key, args in batch:
+            try:
+                getattr(self._client(api_key), method)(*args)
+            except Exception:
+                failed += 1
+            finally:
+                self._queue.task_done()
+        self._count('batches')
+        self._count('sent', len(batch) - failed)
+        if failed:
+            self._count('failed', failed)
+            report_error("dashbot: %d of %d events failed" % (failed, len(batch)))
+
+    def _client(self, api_key):
+        client = self._clients.get(api_key)
+        if client is None:
+            client = self._clients[api_key] = self.client_factory(api_key)
+        return client
+
+
+analytics = AnalyticsQueue(
+    maxsize=int(os.environ.get('ANALYTICS_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)),
+    batch_size=int(os.environ.get('ANALYTICS_BATCH_SIZE', DEFAULT_BATCH_SIZE)),
+    drop_policy=os.environ.get('ANALYTICS_DROP_POLICY', DROP_NEWEST))
+atexit.register(analytics.close)
@@ -0,0 +1,46 @@
+"""Asyncio serving mode of the m_dining webhook, run with ``uvicorn asyncmain:app``.
+
+``POST /webhook`` is answered by a coroutine that checks authentication and runs
+the intent handler on the blocking-call pool. Dashbot logging is only queued, so
+it never waits on the network. Every other route is served by the
+Flask app in `main`.
+"""
+import copy
+
+from asyncserve import AsyncApp, requires_auth, run_blocking
+from auth import authenticator
+from main import app as flask_app, analytics, dispatch_intent, intent_label, request_intent
+from metrics import span, trace_request
+from secretstore import get_secrets
+
+
+@requires_auth(authenticator.check_authorization)
+async def webhook(request):
+    """Async Dialogflow webhook POST Request handler requiring authentication.
+       Answers exactly like `main.webhook_post`. Rejected requests are not traced.
+    """
+    with trace_request(intent_label(request_intent(request.get_json(silent=True)))):
+        return await answer_webhook(request)
+
+
+async def answer_webhook(request):
+    req_data = request.get_json()
+
+    #The intent handler edits its own copy of the request, so the incoming event logs the original
+    handled_data = copy.deepcopy(req_data)
+    responsedata = await run_blocking(dispatch_intent, handled_data)
+
+    #Secrets were loaded by the authentication check, this reads the cached copy
+    with span('secrets'):
+        secrets = get_secrets()
+
+    #Dashbot logging is queued and sent by a background worker
+    dashbot_api = secrets.get('dashbot_api')
+    with span('analytics'):
+        analytics.log_incoming(dashbot_api, req_data)
+        analytics.log_outgoing(dashbot_api, handled_data, responsedata)
+
+    return responsedata
+
+
+app = AsyncApp(flask_app, {('POST', '/webhook'): webhook})
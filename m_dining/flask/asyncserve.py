@@ -0,0 +1 @@
+../../common/asyncserve.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../common/auth.py
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""Circuit breaker guarding calls to a flaky upstream service.
+
+The breaker opens after ``failure_threshold`` consecutive failures, where a call
+slower than ``slow_call_seconds`` counts as a failure even if it succeeded.
+While open, calls are refused without touching the upstream. After
+``reset_timeout`` seconds a single trial call is let through (half-open) and
+its outcome closes or re-opens the breaker. Every transition is logged.
+"""
+import threading
+import time
+
+from eventlog import event_log
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+#Numeric state codes exported as a gauge
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_SLOW_CALL_SECONDS = 2.5
+DEFAULT_RESET_TIMEOUT = 30
+
+
+class CircuitBreaker:
+    """Thread-safe closed/open/half-open circuit breaker.
+
+    :param name: Name of the guarded service, used in logs
+    :type name: string
+    :param failure_threshold: Consecutive failed or slow calls that open the breaker
+    :type failure_threshold: int
+    :param slow_call_seconds: Duration above which a successful call counts as a failure
+    :type slow_call_seconds: float
+    :param reset_timeout: Seconds the breaker stays open before allowing a trial call
+    :type reset_timeout: float
+    :param clock: Function returning the current time in seconds
+    :type clock: function
+    """
+    def __init__(self, name, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 slow_call_seconds=DEFAULT_SLOW_CALL_SECONDS, reset_timeout=DEFAULT_RESET_TIMEOUT,
+                 clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self._counters = {'successes': 0, 'failures': 0, 'slow_calls': 0,
+                          'short_circuits': 0, 'opened': 0, 'transitions': 0}
+
+    def allow(self):
+        """Returns True if a call may go to the upstream now.
+           Once the reset timeout has passed, only one trial call is allowed at a time.
+        """
+        with self._lock:
+            if self.state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN, 'reset timeout elapsed')
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self._counters['short_circuits'] += 1
+            return False
+
+    def record_success(self, elapsed):
+        """Records a completed call, which counts as a failure if slower than ``slow_call_seconds``.
+
+        :param elapsed: Duration of the call in seconds
+        :type elapsed: float
+        """
+        if elapsed > self.slow_call_seconds:
+            with self._lock:
+                self._counters['slow_calls'] += 1
+            self.record_failure('slow call %.0fms' % (1000 * elapsed))
+            return
+        with self._lock:
+            self._counters['successes'] += 1
+            self._failures = 0
+            self._trial_running = False
+            if self.state != CLOSED:
+                self._transition(CLOSED, 'trial call succeeded')
+
+    def record_failure(self, reason='call failed'):
+        """Records a failed call, opening the breaker once the threshold is reached
+           or when a half-open trial call fails.
+        """
+        with self._lock:
+            self._counters['failures'] += 1
+            self._failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = self.clock()
+                self._counters['opened'] += 1
+                self._transition(OPEN, '%s, %d consecutive failures' % (reason, self._failures))
+
+    def stats(self):
+        """Returns the current state and call counters.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['state'] = self.state
+            stats['state_code'] = STATE_CODES[self.state]
+            stats['consecutive_failures'] = self._failures
+        return stats
+
+    def _transition(self, state, reason):
+        previous, self.state = self.state, state
+        self._counters['transitions'] += 1
+        event_log.log('circuit_breaker: %s %s -> %s (%s)' % (self.name, previous, state, reason),
+                      message_type='circuit_breaker')
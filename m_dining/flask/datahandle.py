@@ -1,27 +1,21 @@
-import requests
-from google.cloud import datastore
-import google.cloud.logging
+from eventlog import event_log
+from secretstore import get_secrets
+from menucache import make_key
+from menufetch import fetcher
+from traits import DISPLAY_NAMES, requisite_masks, satisfies
+from metrics import span
 
 ###Helper functions
 
 def report_error(error_text):
-    """Logs error to Stackdriver.
+    """Queues error to be logged to Stackdriver in the background,
+       subject to per-type rate limiting (type is the text before the first ':').
     :param error_text: The text to log to Stackdriver
     :type error_text: string
     """
-    client = google.cloud.logging.Client()
-    logger = client.logger("automated_error_catch")
-    logger.log_text(error_text)
-
-def get_secrets():
-    """Fetches secrets from Datastore and returns them as a list.
-    """
-    client = datastore.Client()
-    query = client.query(kind='env_vars')
-    entity = query.fetch()
-    secrets = list(entity)[0]
-    return secrets
+    event_log.log(error_text)
 
+@span('formatting')
 def format_requisites(text, requisites):
     """If any item requisites specified, adds them to response text data for more holistic response.
 
@@ -33,10 +27,7 @@ def format_requisites(text, requisites):
     traits_text = ''
     allergens_text = ''
 
-    req_map = {'trait': {'mhealthy': 'healthy'},
-               'allergens': {'sesame-seed': 'sesame seeds',
-                             'tree-nuts': 'tree nuts',
-                             'wheat_barley_rye': 'wheat or barley or rye'}}
+    req_map = DISPLAY_NAMES
 
     #If traits specified, extract into a string
     for i, trait in enumerate(requisites['trait']):
@@ -93,83 +84,93 @@ def remove_spaces(url_block):
             temp += url_block[i]
     return temp
 
-def check_meal_available(data, meal):
-    """Searches response data to check if meal is available at specified location/date.
+def day_menu_url(loc_in, date_in):
+    """Builds the MDining API url for a location's menu over a whole day.
+
+    :param loc_in: Input location
+    :type loc_in: string
+    :param date_in: Input date
+    :type date_in: string
+    """
+    with span('secrets'):
+        secrets = get_secrets()
+    url = secrets.get('m_dining_api_main')
+    location = '&location='
+    date = '&date='
+    meal = '&meal='
 
-    :param data: MDining API HTTP response data
-    :type data: dict
+    #API url concatenation
+    location += loc_in
+    date += str(date_in)
+    url = url + location + date + meal
+    return remove_spaces(url)
+
+def fetch_menu(loc_in, date_in):
+    """Returns the whole-day `menuindex.ParsedMenu` of a location, answering from the
+       menu cache when possible (stale while it is refreshed). Both intents answer
+       from this one day-level fetch. Raises `menufetch.MenuUnavailable` if the
+       menu can't be fetched.
+
+    :param loc_in: Input location
+    :type loc_in: string
+    :param date_in: Input date
+    :type date_in: string
+    """
+    return fetcher.fetch(day_menu_url(loc_in, date_in), make_key(loc_in, date_in))
+
+def check_meal_available(menu, meal):
+    """Searches menu to check if meal is available at specified location/date.
+
+    :param menu: Parsed MDining API HTTP response data
+    :type menu: menumodel.Menu
     :param meal: Name of meal
     :type meal: string
     """
-    for key in data['menu']['meal']:
-        if data['menu']['meal']['name'].upper() == meal.upper():
-            if 'course' in data['menu']['meal']:
-                return True
-            return False
+    for item in menu.meals:
+        if item.name.upper() == meal.upper():
+            return item.has_courses
     return False
 
-def check_course_available(data, course):
-    """Searches response data to check if course is available in specified meal.
+def check_course_available(menu, course):
+    """Searches menu to check if course is available in specified meal.
 
-    :param data: MDining API HTTP response data
-    :type data: dict
+    :param menu: Parsed MDining API HTTP response data
+    :type menu: menumodel.Menu
     :param course: Name of course
     :type course: string
     """
-    for i in range(len(data['menu']['meal']['course'])):
-        for key, value in data['menu']['meal']['course'][i].items():
-            if key == 'name':
-                if value.upper() == course.upper():
-                    return True
+    for meal in menu.meals:
+        for item in meal.courses:
+            if item.name is not None and item.name.upper() == course.upper():
+                return True
     return False
 
 
 
-def check_item_specifications(item, traits, allergens):
+def check_item_specifications(entry, masks):
     """Returns true if food item is satisfactory with specified traits and allergens.
 
-    :param item: Data of specific food item
-    :type item: dict
-    :param traits: List of specified traits item must have, can be empty
-    :type traits: list
-    :param allergens: List of allergens item cannot have, can be empty
-    :type allergens: list
+    :param entry: Food item from a `menuindex.MenuItemIndex`
+    :type entry: menuindex.MenuEntry
+    :param masks: Compiled (trait mask, allergen mask) from `traits.requisite_masks`
+    :type masks: tuple
     """
-    #Return false if allergens list isn't empty and any allergens found
-    if allergens and 'allergens' in item:
-        for allergen in allergens:
-            if allergen in item['allergens']:
-                return False
-
-    #Return true if traits list empty
-    if not traits:
-        return True
-
-    #Return false if traits list isn't empty and any traits are missing
-    if 'trait' in item:
-        for trait in traits:
-            if trait not in item['trait']:
-                return False
-
-        #All traits found, return true
-        return True
-    else:
-        return False
+    return satisfies(entry.traits, entry.allergens, masks)
 
-def get_items(data, requisites, formatted):
+@span('formatting')
+def get_items(menu, requisites, formatted):
     """Returns string of food items of each course in response data for
        fulfillmentText in response to Dialogflow.
 
-    :param data: MDining API HTTP response data
-    :type data: dict
+    :param menu: Parsed MDining API HTTP response data
+    :type menu: menuindex.ParsedMenu
     :param requisites: Contains information food item must comply with (traits, allergens, etc)
     :type requisites: dict
     :param formatted: True/False - formats response string if true
     :type formatted: boolean
     """
     returndata = ""
-    traits = requisites['trait']
-    allergens = requisites['allergens']
+    masks = requisite_masks(requisites)
 
     if formatted:
         prefix = '\t'
@@ -178,21 +179,13 @@ def get_items(data, requisites, formatted):
         prefix = ''
         suffix = ', '
 
-    for course in data['menu']['meal']['course']:
-        item_data = []
-        datatype = type(course['menuitem'])
-
-        if datatype is list:
-            item_data += course['menuitem']
-        else:
-            item_data.append(course['menuitem'])
-
-        for item in item_data:
-            if check_item_specifications(item, traits, allergens) and 'No Service at this Time' not in item['name']:
-                returndata += (prefix + (item['name']).rstrip(', ') + suffix)
+    for entry in menu.items.entries:
+        if check_item_specifications(entry, masks) and 'No Service at this Time' not in entry.name:
+            returndata += (prefix + (entry.item.name).rstrip(', ') + suffix)
 
     return returndata
 
+@span('formatting')
 def find_item_formatting(possible_matches):
     """Formatting list of possible matches into more natural sentence structure
        by removing redundancy:
@@ -216,41 +209,24 @@ def find_item_formatting(possible_matches):
     return possible_matches
 
 
-def find_matches(course_data, possible_matches, item_in, meal_name, requisites):
-    """Appends matches of specified food item in data of an individual course to
+def find_matches(entries, possible_matches, requisites):
+    """Appends food items from a menu index search that comply with requisites to
        list of possible matches.
 
-    :param course_data: Chosen course subsection of MDining API HTTP response data
-    :type course_data: dict
+    :param entries: Matching entries from `menuindex.MenuItemIndex.lookup`
+    :type entries: list
     :param possible_matches: List of food items in data that matched user input
     :type possible_matches: list
-    :param item_in: User input food item
-    :type item_in: string
-    :param meal_name: Name of meal
-    :type meal_name: string
     :param requisites: Contains information food item must comply with (traits, allergens, etc)
     :type requisites: dict
     """
 
-    traits = requisites['trait']
-    allergens = requisites['allergens']
-
-    item_data = []
-    datatype = type(course_data)
-
-    if datatype is list:
-        item_data += course_data
-    else:
-        item_data.append(course_data)
+    masks = requisite_masks(requisites)
 
-    for item in item_data:
-        if check_item_specifications(item, traits, allergens) == False:
+    for entry in entries:
+        if check_item_specifications(entry, masks) == False:
             continue
-        if item_in.upper() in item['name'].upper():
-            if item['name'][-1] == ' ':
-                item['name'] = item['name'][:-1]
-
-            possible_matches.append(item['name'] + ' during ' + meal_name)
+        possible_matches.append(entry.name + ' during ' + entry.meal)
 
     return possible_matches
 
@@ -260,6 +236,7 @@ def find_matches(course_data, possible_matches, item_in, meal_name, requisites):
 ###Primary Handler Functions
 
 
+@span('request_location_and_meal')
 def request_location_and_meal(date_in, loc_in, meal_in, requisites):
     """Handles searching for appropriate data response for valid specified
        location and meal entities from ``findLocationAndMeal`` intent.
@@ -274,30 +251,18 @@ def request_location_and_meal(date_in, loc_in, meal_in, requisites):
     :type requisites: dict
     """
 
-    #preset vars
-    url = 'http://api.studentlife.umich.edu/menu/xml2print.php?controller=&view=json'
-    location = '&location='
-    date = '&date='
-    meal = '&meal='
-
-    #API url concatenation
-    location += loc_in
-    meal += meal_in
-    date += str(date_in)
-    url = url + location + date + meal
-    url = remove_spaces(url)
-
-    #fetching json
-    data = requests.get(url).json()
+    #fetching json, selecting the meal from the location's whole day
+    menu = fetch_menu(loc_in, date_in).meal(meal_in)
 
     #checking if specified meal available
-    if check_meal_available(data, meal_in):
-        returnstring = (get_items(data, requisites, False)).rstrip(', ')
+    if check_meal_available(menu.menu, meal_in):
+        returnstring = (get_items(menu, requisites, False)).rstrip(', ')
         return format_plural(returnstring)
     else:
         return "No meal is available"
 
 #Handle meal item data request
+@span('request_item')
 def request_item(date_in, loc_in, item_in, meal_in, requisites):
     """Handles searching for appropriate data response for valid specified
        location and food item entities (and meal entity if included) from ``findItem`` intent.
@@ -313,48 +278,13 @@ def request_item(date_in, loc_in, item_in, meal_in, requisites):
     :param requisites: Contains information food item must comply with (traits, allergens, etc)
     :type requisites: dict
     """
-    secrets = get_secrets()
-    url = secrets.get('m_dining_api_main')
-    location = '&location='
-    date = '&date='
-    meal = '&meal='
-
-    #API url concatenation
-    location += loc_in
-    date += str(date_in)
-    url = url + location + date + meal
-    url = remove_spaces(url)
-
-    if meal_in == '':
-        meal_entered = False
-    else:
-        meal_entered = True
-
     #fetching json
-    data = requests.get(url).json()
-
-    possible_matches = []
+    menu = fetch_menu(loc_in, date_in)
 
-    #Loop through meals
-    for i in data['menu']['meal']:
-
-        #If meal specified, only check specified meal
-        if meal_entered and i['name'].upper() != meal_in.upper():
-            continue
-        #Skip meal if no food items available
-        if 'course' not in i:
-            continue
+    #Look up item in the menu index by whole words, then by substring, only in specified meal if any
+    entries = menu.items.lookup(item_in, meal_in)
+    possible_matches = find_matches(entries, [], requisites)
 
-        #Loop through food items in course
-        for j in i['course']:
-            for key, value in j.items():
-                if key == 'name':
-                    course_data = j['menuitem']
-                    meal_name = i['name']
-                    #Append matches to specified item to possible_matches list
-                    possible_matches = find_matches(course_data, possible_matches,
-                                                    item_in, meal_name, requisites)
-    
     #Specified item found
     if possible_matches:
         possible_matches = find_item_formatting(possible_matches)
@@ -0,0 +1,110 @@
+"""Immutable in-memory index of the Location and Meal entity files and ``ignore.json``.
+
+Built once at import so that entity validation in ``main`` does no file I/O
+on the request path.
+"""
+import json
+import os
+from types import MappingProxyType
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENTITY_FILES = {'LOCATION': ('LocationMain.txt', 'LocationExtra.txt', 'LocationFull.txt'),
+                'MEAL': ('MealMain.txt', 'MealExtra.txt', 'MealFull.txt')}
+
+
+def read_terms(filename):
+    """Returns the lines of an entity file with line endings stripped.
+
+    :param filename: Name of the entity file (e.g. 'LocationMain.txt')
+    :type filename: string
+    """
+    with open(os.path.join(DATA_DIR, filename)) as file:
+        return tuple(line.rstrip('\n\r') for line in file)
+
+
+def normalize(term):
+    """Returns ``term`` case-folded with surrounding whitespace stripped and inner runs
+       of whitespace collapsed to one space, the form every entity lookup compares.
+
+    :param term: Entity term or user input (e.g. ' North  Quad ')
+    :type term: string
+    """
+    return ' '.join(term.split()).casefold()
+
+
+class EntityIndex:
+    """Normalized lookup tables for one entity category.
+
+    :param main_terms: Official full terms (e.g. contents of ``LocationMain.txt``)
+    :type main_terms: iterable
+    :param partial_terms: Split up versions of the full terms (e.g. ``LocationExtra.txt``)
+    :type partial_terms: iterable
+    :param full_terms: Every synonym the Dialogflow entity accepts (e.g. ``LocationFull.txt``)
+    :type full_terms: iterable
+    """
+    __slots__ = ('main_terms', 'full_terms', '_main', '_partial', '_known', '_suggestions')
+
+    def __init__(self, main_terms, partial_terms, full_terms=()):
+        self.main_terms = tuple(main_terms)
+        self.full_terms = tuple(full_terms)
+        self._main = frozenset(normalize(term) for term in self.main_terms)
+        self._partial = frozenset(normalize(term) for term in partial_terms)
+        self._known = self._main | frozenset(normalize(term) for term in self.full_terms)
+
+        #Precompute partial term -> full terms containing it, in file order
+        self._suggestions = MappingProxyType({
+            partial: tuple(term for term in self.main_terms if partial in normalize(term))
+            for partial in self._partial
+        })
+
+    @classmethod
+    def from_files(cls, main_filename, partial_filename, full_filename=None):
+        """Builds an index from the entity files of a category.
+        """
+        full_terms = read_terms(full_filename) if full_filename else ()
+        return cls(read_terms(main_filename), read_terms(partial_filename), full_terms)
+
+    def is_term(self, search):
+        """Returns True if ``search`` is an official full term.
+        """
+        return normalize(search) in self._main
+
+    def is_known(self, search):
+        """Returns True if ``search`` is an official full term or a synonym from the Full list.
+        """
+        return normalize(search) in self._known
+
+    def is_partial(self, search):
+        """Returns True if ``search`` is part of a larger official term.
+        """
+        return normalize(search) in self._partial
+
+    def suggestions(self, search):
+        """Returns the full terms containing the partial term ``search``.
+        """
+        return self._suggestions.get(normalize(search), ())
+
+    def __len__(self):
+        return len(self.main_terms)
+
+
+INDEXES = MappingProxyType({category: EntityIndex.from_files(*filenames)
+                            for category, filenames in ENTITY_FILES.items()})
+
+
+def read_ignored(filename='ignore.json'):
+    """Returns the terms to ignore for each category in ``ignore.json`` as frozensets.
+    """
+    with open(os.path.join(DATA_DIR, filename)) as file:
+        return MappingProxyType({category: frozenset(terms)
+                                 for category, terms in json.load(file).items()})
+
+
+IGNORED = read_ignored()
+
+
+def get_index(category):
+    """Returns the index for an entity category ('Location'/'Meal'), or None.
+    """
+    return INDEXES.get(category.upper())
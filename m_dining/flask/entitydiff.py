@@ -0,0 +1,99 @@
+"""Snapshot-driven diff of the MDining meal/location option lists against the
+local entity files, used by the ``/cron`` handler.
+
+The last fetched list of each category is remembered by its content hash (and
+ETag when the API sends one). An unchanged list skips parsing and diffing and
+reuses the previous result. Otherwise added/removed entries are computed with
+set operations against the preloaded ``ignore.json`` terms. A new snapshot is
+only remembered once the caller `commit`\ s it (e.g. after Slack was notified),
+so a change keeps being reported until it has been delivered.
+"""
+import hashlib
+import threading
+import time
+
+from entities import IGNORED, get_index
+from httpclient import http
+
+
+class Snapshot:
+    """Content hash, ETag and diff result of the last fetched option list.
+    """
+    __slots__ = ('digest', 'etag', 'added', 'removed')
+
+    def __init__(self, digest, etag, added, removed):
+        self.digest = digest
+        self.etag = etag
+        self.added = added
+        self.removed = removed
+
+
+def option_values(data):
+    """Returns the non-empty ``optionValue`` entries of an option-list response as a set.
+
+    :param data: MDining API option-list response
+    :type data: list
+    """
+    return {entry['optionValue'] for entry in data if entry['optionValue'] != ""}
+
+
+def diff_terms(original, new, ignored):
+    """Returns sorted (added, removed) terms between two collections, skipping ignored terms.
+
+    :param original: Terms currently in the local entity file
+    :type original: iterable
+    :param new: Terms currently returned by the MDining API
+    :type new: iterable
+    :param ignored: Terms to leave out of the comparison
+    :type ignored: frozenset
+    """
+    original = set(original) - ignored
+    new = set(new) - ignored
+    return sorted(new - original), sorted(original - new)
+
+
+class EntityDiffer:
+    """Diffs option lists against the entity index, remembering one snapshot per category.
+    """
+    def __init__(self):
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def diff(self, category, url):
+        """Fetches the option list of ``category`` ('Location'/'Meal') from ``url``.
+           Returns the added and removed terms, a dict saying whether the list
+           changed since the last committed run with fetch/diff timings in milliseconds,
+           and the new snapshot to pass to `commit` once the change is handled.
+        """
+        snapshot = self._snapshots.get(category)
+        headers = {'If-None-Match': snapshot.etag} if snapshot and snapshot.etag else {}
+
+        start = time.perf_counter()
+        response = http.post(url, headers=headers)
+        fetched = time.perf_counter()
+
+        if snapshot and response.status_code == 304:
+            digest = snapshot.digest
+        else:
+            digest = hashlib.sha256(response.content).hexdigest()
+
+        changed = snapshot is None or digest != snapshot.digest
+        if changed:
+            added, removed = diff_terms(get_index(category).main_terms,
+                                        option_values(response.json()),
+                                        IGNORED.get(category, frozenset()))
+            snapshot = Snapshot(digest, response.headers.get('ETag'), added, removed)
+
+        info = {'changed': changed,
+                'fetch_ms': round(1000 * (fetched - start), 1),
+                'diff_ms': round(1000 * (time.perf_counter() - fetched), 1)}
+        return list(snapshot.added), list(snapshot.removed), info, snapshot
+
+    def commit(self, category, snapshot):
+        """Remembers ``snapshot`` as the last handled option list of ``category``.
+        """
+        with self._lock:
+            self._snapshots[category] = snapshot
+
+
+differ = EntityDiffer()
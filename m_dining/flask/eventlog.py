@@ -0,0 +1,259 @@
+"""Buffered error and event logging.
+
+Messages are queued in process and written by a background thread in batches
+through one long-lived sink: Stackdriver in production, or stdout/a local file
+(``EVENT_LOG_SINK=stdout`` or ``EVENT_LOG_SINK=/path/to/file``) for tests.
+Each message type is rate limited by a token bucket and can be sampled, and
+suppressed messages are counted on the next message of that type that gets through.
+"""
+import atexit
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+DEFAULT_LOG_NAME = 'automated_error_catch'
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 2.0
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 10
+
+
+class StackdriverSink:
+    """Writes batches to a Stackdriver logger through a single shared client.
+
+    :param log_name: Name of the Stackdriver log
+    :type log_name: string
+    """
+    def __init__(self, log_name=DEFAULT_LOG_NAME):
+        self.log_name = log_name
+        self._logger = None
+
+    def write(self, records):
+        if self._logger is None:
+            import google.cloud.logging
+            self._logger = google.cloud.logging.Client().logger(self.log_name)
+        batch = self._logger.batch()
+        for record in records:
+            batch.log_text(format_text(record))
+        batch.commit()
+
+
+class StreamSink:
+    """Writes each record as a JSON line to a stream.
+
+    :param stream: File-like object, defaults to stdout
+    :type stream: file
+    """
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def write(self, records):
+        for record in records:
+            self.stream.write(json.dumps(record) + '\n')
+        self.stream.flush()
+
+
+class FileSink(StreamSink):
+    """Appends each record as a JSON line to a local file.
+
+    :param path: Path of the log file
+    :type path: string
+    """
+    def __init__(self, path):
+        super().__init__(open(path, 'a'))
+
+
+def format_text(record):
+    """Formats a record as the plain text line written to Stackdriver.
+    """
+    text = record['text']
+    if record.get('suppressed'):
+        text += ' (%d similar suppressed)' % record['suppressed']
+    return text
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second with bursts of up to ``burst`` events.
+    """
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class EventLogger:
+    """Rate limited, sampled event logger with a batching background sender.
+
+    :param sink: Object with a ``write(records)`` method
+    :type sink: object
+    :param rate: Messages per second allowed for each message type
+    :type rate: float
+    :param burst: Messages of one type allowed in a burst
+    :type burst: int
+    :param sample_rates: Fraction of messages kept for each message type, default 1
+    :type sample_rates: dict
+    :param maxsize: Maximum number of buffered messages
+    :type maxsize: int
+    :param batch_size: Maximum number of messages per sink write
+    :type batch_size: int
+    :param flush_interval: Seconds the sender waits to fill a batch
+    :type flush_interval: float
+    """
+    def __init__(self, sink, rate=DEFAULT_RATE, burst=DEFAULT_BURST, sample_rates=None,
+                 maxsize=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.sink = sink
+        self.rate = rate
+        self.burst = burst
+        self.sample_rates = sample_rates or {}
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._buckets = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._counters = {'logged': 0, 'written': 0, 'rate_limited': 0, 'sampled_out': 0,
+                          'dropped': 0, 'write_failures': 0}
+
+    def log(self, text, message_type=None, **fields):
+        """Queues a message, returns False if it was rate limited, sampled out or dropped.
+
+        :param text: Message text
+        :type text: string
+        :param message_type: Key for rate limiting and sampling,
+                             defaults to the text before the first ':'
+        :type message_type: string
+        """
+        if message_type is None:
+            message_type = text.split(':', 1)[0]
+
+        with self._lock:
+            if random.random() >= self.sample_rates.get(message_type, 1.0):
+                self._counters['sampled_out'] += 1
+                return False
+            bucket = self._buckets.get(message_type)
+            if bucket is None:
+                bucket = self._buckets[message_type] = TokenBucket(self.rate, self.burst)
+            if not bucket.take():
+                self._counters['rate_limited'] += 1
+                self._suppressed[message_type] = self._suppressed.get(message_type, 0) + 1
+                return False
+            suppressed = self._suppressed.pop(message_type, 0)
+
+        record = dict(fields, type=message_type, text=text, time=time.time())
+        if suppressed:
+            record['suppressed'] = suppressed
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('logged')
+        return True
+
+    def flush(self):
+        """Writes every buffered message synchronously.
+        """
+        while True:
+            batch = self._take_batch(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def stats(self):
+        """Returns logged/written/rate limited/sampled/dropped counters and queue depth.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+        stats['depth'] = self._queue.qsize()
+        return stats
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='event-log-sender',
+                                                daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._take_batch(block=True)
+            if batch:
+                self._write(batch)
+
+    def _take_batch(self, block):
+        batch = []
+        try:
+            batch.append(self._queue.get(block=block))
+            deadline = time.monotonic() + (self.flush_interval if block else 0)
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch):
+        try:
+            self.sink.write(batch)
+            self._count('written', len(batch))
+        except Exception as error:
+            self._count('write_failures')
+            sys.stderr.write('Event log write of %d records failed: %r\n' % (len(batch), error))
+
+
+def parse_sample_rates(value):
+    """Parses ``type=rate,type=rate`` into a dict of sample rates.
+    """
+    rates = {}
+    for pair in filter(None, value.split(',')):
+        message_type, rate = pair.split('=')
+        rates[message_type.strip()] = float(rate)
+    return rates
+
+
+def make_sink(name):
+    """Returns the sink named by ``EVENT_LOG_SINK``: 'stackdriver', 'stdout' or a file path.
+    """
+    if name == 'stackdriver':
+        return StackdriverSink()
+    if name == 'stdout':
+        return StreamSink()
+    return FileSink(name)
+
+
+event_log = EventLogger(
+    make_sink(os.environ.get('EVENT_LOG_SINK', 'stackdriver')),
+    rate=float(os.environ.get('EVENT_LOG_RATE', DEFAULT_RATE)),
+    burst=int(os.environ.get('EVENT_LOG_BURST', DEFAULT_BURST)),
+    sample_rates=parse_sample_rates(os.environ.get('EVENT_LOG_SAMPLE', '')))
+atexit.register(event_log.flush)
@@ -0,0 +1,108 @@
+"""Trigram fuzzy matching of Location and Meal names for "Did you mean ..." responses.
+
+Built once at import over the Main, Extra and Full entity lists. A query is
+scored against every vocabulary term sharing a trigram with it, and each
+matched term is resolved to the official full names it stands for: a Main term
+to itself, a partial (Extra) term to the full names containing it, and any other
+Full list alias to its closest full name.
+"""
+import os
+from types import MappingProxyType
+
+from entities import INDEXES, normalize
+
+DEFAULT_LIMIT = 3
+DEFAULT_MIN_SCORE = float(os.environ.get('FUZZY_MIN_SCORE', 0.35))
+
+
+def trigrams(text):
+    """Returns the set of character trigrams of a normalized, space-padded string.
+    """
+    padded = '  ' + normalize(text) + ' '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class TrigramIndex:
+    """Inverted index from trigrams to terms, scored with the Dice coefficient.
+
+    :param terms: Vocabulary to index
+    :type terms: iterable
+    """
+    __slots__ = ('terms', '_grams', '_postings')
+
+    def __init__(self, terms):
+        self.terms = tuple(dict.fromkeys(term for term in terms if term.strip()))
+        self._grams = tuple(trigrams(term) for term in self.terms)
+        postings = {}
+        for position, grams in enumerate(self._grams):
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+        self._postings = MappingProxyType({gram: tuple(positions)
+                                           for gram, positions in postings.items()})
+
+    def search(self, query, limit=DEFAULT_LIMIT, min_score=DEFAULT_MIN_SCORE):
+        """Returns up to ``limit`` (term, score) pairs, best first, with score >= ``min_score``.
+        """
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        shared = {}
+        for gram in query_grams:
+            for position in self._postings.get(gram, ()):
+                shared[position] = shared.get(position, 0) + 1
+
+        scored = []
+        for position, count in shared.items():
+            score = 2.0 * count / (len(query_grams) + len(self._grams[position]))
+            if score >= min_score:
+                scored.append((-score, self.terms[position]))
+        scored.sort()
+        return [(term, -score) for score, term in scored[:limit]]
+
+
+class FuzzyMatcher:
+    """Ranks official full names of one entity category for a possibly misspelled query.
+
+    :param entity_index: Exact lookup index of the category, including its Full list
+    :type entity_index: entities.EntityIndex
+    """
+    def __init__(self, entity_index):
+        main_terms = [term for term in entity_index.main_terms if term.strip()]
+        self._main = TrigramIndex(main_terms)
+        self._vocabulary = TrigramIndex(main_terms + list(entity_index.full_terms))
+
+        #Resolve every vocabulary term to the full names it stands for
+        resolved = {}
+        for term in self._vocabulary.terms:
+            if entity_index.is_term(term):
+                resolved[term] = (term,)
+            elif entity_index.is_partial(term):
+                resolved[term] = entity_index.suggestions(term)
+            else:
+                resolved[term] = tuple(name for name, score in self._main.search(term, limit=1, min_score=0))
+        self._resolved = MappingProxyType(resolved)
+
+    def suggest(self, query, limit=DEFAULT_LIMIT, min_score=DEFAULT_MIN_SCORE):
+        """Returns up to ``limit`` (full name, score) pairs for ``query``, best first.
+        """
+        best = {}
+        for term, score in self._vocabulary.search(query, limit=limit * 4, min_score=min_score):
+            for name in self._resolved[term]:
+                if score > best.get(name, 0):
+                    best[name] = score
+        ranked = sorted(best.items(), key=lambda pair: (-pair[1], pair[0]))
+        return ranked[:limit]
+
+
+MATCHERS = MappingProxyType({category: FuzzyMatcher(index)
+                             for category, index in INDEXES.items()})
+
+
+def suggest(search, category, limit=DEFAULT_LIMIT):
+    """Returns up to ``limit`` (full name, score) suggestions for ``search`` in a
+       category ('Location'/'Meal'), best first.
+    """
+    matcher = MATCHERS.get(category.upper())
+    if matcher is None:
+        return []
+    return matcher.suggest(normalize(search), limit)
@@ -0,0 +1,198 @@
+"""Shared HTTP client for all outbound calls (MDining API, Slack).
+
+Keeps one ``requests.Session`` with a keep-alive connection pool per host,
+applies connect/read timeouts to every call, retries connection failures and
+502/503/504 responses a bounded number of times with jittered backoff, and
+records latency per host. Every call, retries included, ends within an overall
+deadline that keeps a webhook's MDining fetch under Dialogflow's 5 second
+webhook timeout. Read timeouts are not retried: a server that stopped
+answering is unlikely to answer a second time within the deadline. Streamed
+bodies read through `HttpClient.iter_body` share the deadline of their call.
+"""
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_CONNECT_TIMEOUT = 1.0
+DEFAULT_READ_TIMEOUT = 2.0
+DEFAULT_DEADLINE = 4.0
+DEFAULT_RETRIES = 1
+DEFAULT_BACKOFF = 0.1
+DEFAULT_POOL_SIZE = 10
+
+RETRY_STATUSES = frozenset([502, 503, 504])
+RETRY_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+
+def capped_timeout(timeout, remaining):
+    """Returns a (connect, read) timeout no longer than ``remaining`` seconds.
+
+    :param timeout: (connect, read) tuple, a single number for both, or None for no timeout
+    :type timeout: tuple
+    :param remaining: Seconds left before the call's deadline
+    :type remaining: float
+    """
+    if not isinstance(timeout, tuple):
+        timeout = (timeout, timeout)
+    return tuple(remaining if value is None else min(value, remaining) for value in timeout)
+
+
+class HostStats:
+    """Latency and error counters for one host.
+    """
+    __slots__ = ('requests', 'errors', 'retries', 'body_timeouts', 'total_time', 'max_time')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.body_timeouts = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def as_dict(self):
+        return {'requests': self.requests,
+                'errors': self.errors,
+                'retries': self.retries,
+                'body_timeouts': self.body_timeouts,
+                'avg_ms': 1000 * self.total_time / self.requests if self.requests else 0.0,
+                'max_ms': 1000 * self.max_time}
+
+
+class HttpClient:
+    """Pooled keep-alive HTTP client with timeouts and bounded retries.
+
+    :param timeout: (connect, read) timeout in seconds applied when a call gives none
+    :type timeout: tuple
+    :param deadline: Seconds allowed for a call including its retries
+    :type deadline: float
+    :param retries: Maximum number of retries for idempotent requests
+    :type retries: int
+    :param backoff: Base backoff in seconds, doubled per attempt with full jitter
+    :type backoff: float
+    :param pool_size: Keep-alive connections kept per host
+    :type pool_size: int
+    """
+    def __init__(self, timeout=(DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT), deadline=DEFAULT_DEADLINE,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, pool_size=DEFAULT_POOL_SIZE):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, retries=None, deadline=None, **kwargs):
+        """Sends a request through the shared session and returns the response.
+        Connection errors (including connect timeouts) and 502/503/504 responses
+        are retried for idempotent methods only. Every attempt's timeouts are cut
+        to what is left of ``deadline`` seconds, and no retry starts after it passed.
+        """
+        method = method.upper()
+        timeout = kwargs.pop('timeout', self.timeout)
+        if retries is None:
+            retries = self.retries if method in RETRY_METHODS else 0
+        if deadline is None:
+            deadline = self.deadline
+        host = urlsplit(url).netloc
+        expires = time.monotonic() + deadline
+
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            remaining = expires - start
+            if remaining <= 0:
+                raise requests.Timeout('%s %s exceeded its %.1fs deadline' % (method, url, deadline))
+            try:
+                response = self.session.request(method, url, timeout=capped_timeout(timeout, remaining),
+                                                **kwargs)
+            except requests.ConnectionError:
+                self._record(host, time.monotonic() - start, error=True)
+                if attempt >= retries:
+                    raise
+            except requests.Timeout:
+                self._record(host, time.monotonic() - start, error=True)
+                raise
+            else:
+                self._record(host, time.monotonic() - start, error=response.status_code >= 500)
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                response.close()
+
+            attempt += 1
+            self._record_retry(host)
+            time.sleep(min(random.uniform(0, self.backoff * (2 ** attempt)),
+                           max(0.0, expires - time.monotonic())))
+
+    def iter_body(self, response, seconds, chunk_size):
+        """Yields the body of a ``stream=True`` response in chunks of up to ``chunk_size``
+        bytes, and raises ``requests.Timeout`` once ``seconds`` have passed. The deadline
+        is checked between chunks; a single read is bounded by the call's read timeout,
+        which `request` already cut to what was left of the call's deadline.
+
+        :param response: Response of a ``stream=True`` request
+        :type response: requests.Response
+        :param seconds: Seconds allowed for reading the body
+        :type seconds: float
+        :param chunk_size: Maximum bytes per chunk
+        :type chunk_size: int
+        """
+        expires = time.monotonic() + seconds
+        for chunk in response.iter_content(chunk_size):
+            if time.monotonic() > expires:
+                self._record_body_timeout(urlsplit(response.url).netloc)
+                raise requests.Timeout('Response body of %s not read within %.1fs' % (response.url, seconds))
+            yield chunk
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """Returns per-host request, error, retry and latency counters.
+        """
+        with self._lock:
+            return {host: stats.as_dict() for host, stats in self._stats.items()}
+
+    def _host_stats(self, host):
+        stats = self._stats.get(host)
+        if stats is None:
+            stats = self._stats.setdefault(host, HostStats())
+        return stats
+
+    def _record(self, host, elapsed, error):
+        with self._lock:
+            stats = self._host_stats(host)
+            stats.requests += 1
+            stats.total_time += elapsed
+            if elapsed > stats.max_time:
+                stats.max_time = elapsed
+            if error:
+                stats.errors += 1
+
+    def _record_retry(self, host):
+        with self._lock:
+            self._host_stats(host).retries += 1
+
+    def _record_body_timeout(self, host):
+        with self._lock:
+            self._host_stats(host).body_timeouts += 1
+
+
+http = HttpClient(
+    timeout=(float(os.environ.get('HTTP_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+             float(os.environ.get('HTTP_READ_TIMEOUT', DEFAULT_READ_TIMEOUT))),
+    deadline=float(os.environ.get('HTTP_DEADLINE', DEFAULT_DEADLINE)),
+    retries=int(os.environ.get('HTTP_RETRIES', DEFAULT_RETRIES)),
+    pool_size=int(os.environ.get('HTTP_POOL_SIZE', DEFAULT_POOL_SIZE)))
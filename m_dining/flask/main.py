@@ -1,31 +1,73 @@
 from functools import wraps
 import datetime
-import json, requests
-import numpy as np
-from flask import Flask, request, jsonify, abort
-from google.cloud import datastore
-import google.cloud.logging
+import json
+from flask import Flask, Response, request, jsonify, abort
 from datahandle import request_location_and_meal, request_item, format_requisites, get_secrets, report_error
-from dashbot import google as dashbotgoogle
+from analytics import analytics
+from entities import IGNORED, INDEXES, get_index
+from fuzzy import suggest
+from entitydiff import differ
+from httpclient import http
+from prefetch import prefetch_menus, default_dates, popular_locations
+from traits import compile_requisites
+import metrics
+from metrics import span, trace_request
+from menucache import menu_cache
+from menufetch import fetcher, breaker, MenuUnavailable
+from eventlog import event_log
+from secretstore import provider as secrets_provider
+from auth import authenticator, check_auth, requires_auth
+from warmup import warmup
 
 app = Flask(__name__)
 
-#Authentication
-def check_auth(name, passw):
-    secrets = get_secrets()
-    passwcheck = secrets.get('pass')
-    usercheck = secrets.get('user')
-    return name == usercheck and passw == passwcheck
-def requires_auth(f):
+#Response when the MDining API can't provide a menu
+MENU_UNAVAILABLE_TEXT = 'Sorry, dining menus are unavailable right now. Please try again in a few minutes.'
+
+#Intents reported as metric labels, anything else is reported as 'other'
+INTENT_LABELS = ('queryHelper', 'findLocationAndMeal', 'findItem', 'resetContexts')
+
+metrics.register_stats('menu_cache', menu_cache.stats)
+metrics.register_stats('menu_fetch', fetcher.stats)
+metrics.register_stats('mdining_breaker', breaker.stats)
+metrics.register_stats('http', http.stats, label='host')
+metrics.register_stats('analytics', analytics.stats)
+metrics.register_stats('event_log', event_log.stats)
+metrics.register_stats('secrets', secrets_provider.stats)
+metrics.register_stats('auth', authenticator.stats)
+metrics.register_stats('warmup', warmup.stats)
+
+def intent_label(intentname):
+    """Maps an intent display name to a bounded set of metric label values.
+
+    :param intentname: Dialogflow intent display name
+    :type intentname: string
+    """
+    for label in INTENT_LABELS:
+        if label in intentname:
+            return label
+    return 'other'
+
+def request_intent(req_data):
+    """Returns the intent display name of a webhook request, or '' if it is malformed.
+
+    :param req_data: Dialogflow webhook request data, None if not JSON
+    :type req_data: dict
+    """
+    try:
+        return str(req_data['queryResult']['intent']['displayName'])
+    except (KeyError, TypeError):
+        return ''
+
+#Request tracing for metrics
+def traced(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        auth = request.authorization
-        if not auth or not check_auth(auth.username, auth.password):
-            abort(401)
-        return f(*args, **kwargs)
+        req_data = request.get_json(silent=True)
+        with trace_request(intent_label(request_intent(req_data))):
+            return f(*args, **kwargs)
     return decorated
 
-
 ###Helper functions
 
 def remove_ignore_entities(data, category):
@@ -37,37 +79,27 @@ def remove_ignore_entities(data, category):
     :param category: Entity category of the search term ('Location'/'Meal')
     :type category: string
     """
-    with open('ignore.json') as file:
-        ignoredata = json.load(file)
-    newdata = []
-    for term in data:
-        copy = True
-        for ignoreterm in ignoredata[category]:
-            if term.strip('\n') == ignoreterm:
-                copy = False
-        if copy:
-            newdata.append(term)
-    return newdata
-
-def is_partial_term(search, filename):
-    """Checks if input term is part of a larger official term by looking for any matches with
-       split up versions of regular terms.
+    ignored = IGNORED[category]
+    return [term for term in data if term.strip('\n') not in ignored]
+
+def is_partial_term(search, category):
+    """Checks if input term is part of a larger official term by looking it up in the
+       split up versions of regular terms held by the entity index.
 
     :param search: The searched term (e.g. 'north quad')
     :type search: string
-    :param filename: Name of the file the term is being searched for in ('LocationExtra.txt')
-    :type filename: string
+    :param category: Entity category of the search term ('Location'/'Meal')
+    :type category: string
     """
-    list_data = open(filename)
-    for i in list_data:
-        if search.upper() == str(i.rstrip("\n\r")).upper():
-            return True
-    return False
+    return get_index(category).is_partial(search)
 
+@span('entity_validation')
 def similar_search(search, category):
     """Handles user input that doesn't match official terms exactly using `is_partial_term`.
        If input ``search`` is a partial term of any official terms,
        returns list of recommended official terms.
+       If it isn't a known term at all (e.g. a typo), recommends the closest official
+       terms ranked by the fuzzy matcher.
 
     :param search: The searched term (e.g. 'north quad')
     :type search: string
@@ -75,28 +107,23 @@ def similar_search(search, category):
     :type filename: string
     """
 
-    #Check type of term and adjust file searched accordingly
-    if category.upper() == 'LOCATION':
-        extras_filename = 'LocationExtra.txt'
-        main_filename = 'LocationMain.txt'
-    elif category.upper() == 'MEAL':
-        extras_filename = 'MealExtra.txt'
-        main_filename = 'MealMain.txt'
-    else:
+    #Check type of term
+    index = get_index(category)
+    if index is None:
         return "File error"
 
     #Check if input term is part of a larger official term
-    if is_partial_term(search, extras_filename) == False:
-        return "Found"
+    if is_partial_term(search, category):
+        #If it is, suggest possible full terms precomputed by the index
+        possible_searches = index.suggestions(search)
 
-    #If it is, suggest possible full terms
-
-    #Go through list of full terms and check for possibilities
-    list_data = open(main_filename, 'r')
-    possible_searches = []
-    for i in list_data:
-        if search.upper() in str(i.rstrip("\n\r")).upper():
-            possible_searches.append(str(i.rstrip("\n\r")))
+    #Otherwise accept known terms, and suggest the closest official terms for unknown ones
+    elif index.is_known(search):
+        return "Found"
+    else:
+        possible_searches = [term for term, score in suggest(search, category)]
+        if not possible_searches:
+            return "Found"
 
     #Suggest list of possibilities
     outputstring = "Did you mean "
@@ -106,6 +133,24 @@ def similar_search(search, category):
 
     return outputstring[:-4] + '?'
 
+def notify_slack(slackurl, slackresponse):
+    """Posts a message to the Slack webhook, returns True if Slack accepted it.
+
+    :param slackurl: Slack incoming webhook url
+    :type slackurl: string
+    :param slackresponse: Slack message data
+    :type slackresponse: dict
+    """
+    try:
+        response = http.post(slackurl, json=slackresponse)
+    except Exception as error:
+        report_error('slack_error: %r' % error)
+        return False
+    if not 200 <= response.status_code < 300:
+        report_error('slack_error: HTTP %d' % response.status_code)
+        return False
+    return True
+
 def add_followup_event_input(responsedata, output_params):
     """Helper function for adding followupEventInput trigger to send data to queryHelper intent.
 
@@ -159,6 +204,9 @@ def requisites_setup(requisites, input_params, output_params, additional_output_
         requisites['allergens'].append('tree-nuts')
         requisites['allergens'].append('peanuts')
 
+    #Compile requisites to bitmasks for item filtering
+    requisites['masks'] = compile_requisites(requisites)
+
     #Adds requisites to output_params if specified
     if requisites['trait']:
         output_params['itemTraitOutputContext'] = requisites['trait']
@@ -261,6 +309,7 @@ def required_entities_handler(req_data, intentname):
 
     return responsedata
 
+@span('find_location_and_meal')
 def find_location_and_meal(req_data):
     """Dialogflow ``find_location_and_meal`` intent handler.
        Checks for valid Location and Meal and sends HTTP response with appropriate data.
@@ -338,6 +387,7 @@ def find_location_and_meal(req_data):
 
     return responsedata
 
+@span('find_item')
 def find_item(req_data):
     """Dialogflow ``find_item`` intent handler.
        Checks for valid Location and Item and sends HTTP response with appropriate data.
@@ -412,6 +462,40 @@ def find_item(req_data):
         responsedata = add_followup_event_input(responsedata, output_params)
 
 
+    return responsedata
+
+def dispatch_intent(req_data):
+    """Answers a Dialogflow webhook request with the handler for its intent,
+       returns the response data.
+
+    :param req_data: Dialogflow webhook request data
+    :type req_data: dict
+    """
+    intentname = req_data['queryResult']['intent']['displayName']
+
+    if 'queryHelper' in intentname:
+        responsedata = ''
+        for i in req_data['queryResult']['outputContexts']:
+            if 'parameters' in i:
+                if 'Data' in i['parameters']:
+                    responsedata = i['parameters']['Data']
+                    break
+        responsedata = {'fulfillmentText': responsedata}
+    elif 'findLocationAndMeal' in intentname or 'findItem' in intentname:
+        #Answer right away if the menu can't be fetched (MDining API down or circuit open)
+        try:
+            if 'findLocationAndMeal' in intentname:
+                responsedata = find_location_and_meal(req_data)
+            else:
+                responsedata = find_item(req_data)
+        except MenuUnavailable:
+            responsedata = {'fulfillmentText': MENU_UNAVAILABLE_TEXT}
+    elif 'resetContexts' in intentname:		
+        responsedata = {}		
+        responsedata = add_followup_event_input(responsedata, {'reset':'reset'})
+    else:
+        responsedata = {'fulfillmentText': 'Not available.'}
+
     return responsedata
 #########################################################################
 ###Primary Handler Functions
@@ -426,48 +510,37 @@ def home():
 #Webhook call
 @app.route('/webhook', methods=['POST'])
 @requires_auth
+@traced
 def webhook_post():
     """Dialogflow webhook POST Request handler requiring authentication.
        Uses `find_location_and_meal` or `find_item` intent handlers and returns appropriate
        JSON response.
     """
-    secrets = get_secrets()
+    with span('secrets'):
+        secrets = get_secrets()
     req_data = request.get_json()
 
-    #Dashbot logging with handling for potential error
-    try:
-        dba = dashbotgoogle.google(secrets.get('dashbot_api'))
-        dba.logIncoming(req_data)
-        dashbot_success = True
-    except:
-        report_error("dashbot")
-        dashbot_success = False
+    #Dashbot logging is queued and sent by a background worker
+    dashbot_api = secrets.get('dashbot_api')
+    with span('analytics'):
+        analytics.log_incoming(dashbot_api, req_data)
 
-    intentname = req_data['queryResult']['intent']['displayName']
-
-    if 'queryHelper' in intentname:
-        responsedata = ''
-        for i in req_data['queryResult']['outputContexts']:
-            if 'parameters' in i:
-                if 'Data' in i['parameters']:
-                    responsedata = i['parameters']['Data']
-                    break
-        responsedata = {'fulfillmentText': responsedata}
-    elif 'findLocationAndMeal' in intentname:
-        responsedata = find_location_and_meal(req_data)
-    elif 'findItem' in intentname:
-        responsedata = find_item(req_data)
-    elif 'resetContexts' in intentname:		
-        responsedata = {}		
-        responsedata = add_followup_event_input(responsedata, {'reset':'reset'})
-    else:
-        responsedata = {'fulfillmentText': 'Not available.'}
+    responsedata = dispatch_intent(req_data)
 
-    if dashbot_success:
-        dba.logOutgoing(req_data, responsedata)
+    with span('analytics'):
+        analytics.log_outgoing(dashbot_api, req_data, responsedata)
     
     return jsonify(responsedata)
 
+#Prometheus metrics
+@app.route('/metrics')
+@requires_auth
+def metrics_get():
+    """Webhook latency histograms by intent and stage, and subsystem counters,
+       in the Prometheus text format. Requires authentication.
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 #Google Cron update handler
 @app.route('/cron', methods=['POST'])
 def cron_update():
@@ -478,117 +551,167 @@ def cron_update():
        Authenticates requests by checking for user and passw in POST request body.
     """
     #Cron authentication through post request data
-    req_data = request.get_json()
+    req_data = request.get_json(silent=True) or {}
 
     #Get secret values from Datastore environment variables
     secrets = get_secrets()
     slackurl = secrets.get('slack_api')
-    passw = secrets.get('pass')
-    user = secrets.get('user')
 
-    if (req_data['user'] != user) or (req_data['pass'] != passw):
-        message = 'Authentication failed.'
-    else:
-        mealchanged = False
-        locationchanged = False
-
-        #Meal Diff
-        mealreq = requests.post(secrets.get('m_dining_api_meals'))
-        mealdata = mealreq.json()
-
-        newmeal = []
-        for entry in mealdata:
-            if entry['optionValue'] != "":
-                newmeal.append(entry['optionValue'])
-
-        originalmealfile = open('MealMain.txt', 'r').readlines()
-        originalmeal = []
-        for entry in originalmealfile:
-            originalmeal.append(entry.strip('\n'))
-
-        originalmeal = np.array(remove_ignore_entities(originalmeal, 'Meal'))
-        newmeal = np.array(remove_ignore_entities(newmeal, 'Meal'))
+    if not check_auth(req_data.get('user'), req_data.get('pass')):
+        return jsonify(message='Authentication failed.'), 401
+
+    #Meal Diff
+    mealadded, mealremoved, mealinfo, mealsnapshot = differ.diff('Meal', secrets.get('m_dining_api_meals'))
+    mealchanged = bool(mealremoved) or bool(mealadded)
+
+    #Location Diff
+    locationadded, locationremoved, locationinfo, locationsnapshot = differ.diff(
+        'Location', secrets.get('m_dining_api_locations'))
+    locationchanged = bool(locationremoved) or bool(locationadded)
+
+    #Only notify Slack when an option list changed since the last delivered run
+    notify = mealinfo['changed'] or locationinfo['changed']
+    notified = False
+    timing = {'meal': mealinfo, 'location': locationinfo}
+
+    #Check for file changes for appropriate response to slack if needed
+    if locationchanged or mealchanged:
+        slackresponse = {}
+        slackresponse['attachments'] = []
+
+        message = "Update needed for "
+        if locationchanged:
+            message += "location"
+            if bool(locationadded):
+                newlocationsstr = ''
+                for i in locationadded:
+                    newlocationsstr = newlocationsstr + i + '\n'
+                slackresponse['attachments'].append({"title": "New locations",
+                                                     "text": newlocationsstr})
+            if bool(locationremoved):
+                removedlocationsstr = ''
+                for i in locationremoved:
+                    removedlocationsstr = removedlocationsstr + i + '\n'
+                slackresponse['attachments'].append({"title": "Removed locations",
+                                                     "text": removedlocationsstr})
+        if mealchanged:
+            if bool(mealadded):
+                newmealsstr = ''
+                for i in mealadded:
+                    newmealsstr = newmealsstr + i + '\n'
+                slackresponse['attachments'].append({"title": "New meals",
+                                                     "text": newmealsstr})
+            if bool(mealremoved):
+                removedmealsstr = ''
+                for i in mealremoved:
+                    removedmealsstr = removedmealsstr + i + '\n'
+                slackresponse['attachments'].append({"title": "Removed meals",
+                                                     "text": removedmealsstr})
+            if locationchanged:
+                message += " and meal"
+            else:
+                message += "meal"
 
+        message += " in m-voice."
+        slackresponse['text'] = message
+        if notify:
+            notified = notify_slack(slackurl, slackresponse)
 
-        mealremoved = np.setdiff1d(originalmeal, newmeal).tolist()
-        mealadded = np.setdiff1d(newmeal, originalmeal).tolist()
-        mealchanged = False
-        if bool(mealremoved) or bool(mealadded):
-            mealchanged = True
+    else:
+        message = "Data up to date"
 
+    #Keep reporting the change on later runs until Slack has received it
+    if notified or not (notify and (locationchanged or mealchanged)):
+        differ.commit('Meal', mealsnapshot)
+        differ.commit('Location', locationsnapshot)
 
-        #Location Diff
-        locationreq = requests.post(secrets.get('m_dining_api_locations'))
-        locationdata = locationreq.json()
+    return jsonify(
+        message=message,
+        locationadded=locationadded,
+        locationremoved=locationremoved,
+        mealadded=mealadded,
+        mealremoved=mealremoved,
+        notified=notified,
+        timing=timing
+    )
 
-        newlocation = []
-        for entry in locationdata:
-            if entry['optionValue'] != "":
-                newlocation.append(entry['optionValue'])
+#Google Cron menu prefetch handler
+@app.route('/cron/prefetch', methods=['POST'])
+def cron_prefetch():
+    """Google Cloud Platform scheduled CRON request handler.
+       Fetches today's and tomorrow's menus for every location in ``LocationMain.txt``
+       and stores them in the menu cache, skipping terms listed in ``ignore.json``.
+       Authenticates requests by checking for user and passw in POST request body.
+    """
+    req_data = request.get_json(silent=True) or {}
 
-        originallocationfile = open('LocationMain.txt', 'r').readlines()
-        originallocation = []
-        for entry in originallocationfile:
-            originallocation.append(entry.strip('\n'))
+    if not check_auth(req_data.get('user'), req_data.get('pass')):
+        return jsonify(message='Authentication failed.'), 401
 
-        originallocation = np.array(remove_ignore_entities(originallocation, 'Location'))
-        newlocation = np.array(remove_ignore_entities(newlocation, 'Location'))
+    locations = remove_ignore_entities(list(get_index('Location').main_terms), 'Location')
+    meals = remove_ignore_entities(list(get_index('Meal').main_terms), 'Meal')
+    report = prefetch_menus(locations, meals, default_dates())
 
-        locationremoved = np.setdiff1d(originallocation, newlocation).tolist()
-        locationadded = np.setdiff1d(newlocation, originallocation).tolist()
-        locationchanged = False
-        if bool(locationremoved) or bool(locationadded):
-            locationchanged = True
+    return jsonify(message='Prefetched menus', **report)
 
-        #Check for file changes for appropriate response to slack if needed
-        if locationchanged or mealchanged:
-            slackresponse = {}
-            slackresponse['attachments'] = []
+#########################################################################
+###Instance warmup steps, run in order by `warmup_get`
 
-            message = "Update needed for "
-            if locationchanged:
-                message += "location"
-                if bool(locationadded):
-                    newlocationsstr = ''
-                    for i in locationadded:
-                        newlocationsstr = newlocationsstr + i + '\n'
-                    slackresponse['attachments'].append({"title": "New locations",
-                                                         "text": newlocationsstr})
-                if bool(locationremoved):
-                    removedlocationsstr = ''
-                    for i in locationremoved:
-                        removedlocationsstr = removedlocationsstr + i + '\n'
-                    slackresponse['attachments'].append({"title": "Removed locations",
-                                                         "text": removedlocationsstr})
-            if mealchanged:
-                if bool(mealadded):
-                    newmealsstr = ''
-                    for i in mealadded:
-                        newmealsstr = newmealsstr + i + '\n'
-                    slackresponse['attachments'].append({"title": "New meals",
-                                                         "text": newmealsstr})
-                if bool(mealremoved):
-                    removedmealsstr = ''
-                    for i in mealremoved:
-                        removedmealsstr = removedmealsstr + i + '\n'
-                    slackresponse['attachments'].append({"title": "Removed meals",
-                                                         "text": removedmealsstr})
-                if locationchanged:
-                    message += " and meal"
-                else:
-                    message += "meal"
-
-            message += " in m-voice."
-            slackresponse['text'] = message
-            requests.post(slackurl, json=slackresponse)
+@warmup.step('entities')
+def warm_entities():
+    """Reports the entity indexes built from the ``Location*.txt`` and ``Meal*.txt`` files.
+    """
+    return {category.title(): {'terms': len(index), 'synonyms': len(index.full_terms)}
+            for category, index in INDEXES.items()}
 
-        else:
-            message = "Data up to date"
+@warmup.step('secrets')
+def warm_secrets():
+    """Loads the secrets, which opens the shared Datastore client.
+    """
+    return {'keys': len(secrets_provider.get())}
 
-    return jsonify(
-        message=message,
-        locationadded=locationadded,
-        locationremoved=locationremoved,
-        mealadded=mealadded,
-        mealremoved=mealremoved
-    )
+@warmup.step('analytics')
+def warm_analytics():
+    """Builds the Dashbot client used by the analytics worker.
+    """
+    dashbot_api = get_secrets().get('dashbot_api')
+    analytics.prepare(dashbot_api)
+    return {'dashbot': bool(dashbot_api)}
+
+@warmup.step('menus')
+def warm_menus():
+    """Prefetches today's menus of the most popular locations, which also opens
+       pooled connections to the MDining API.
+    """
+    index = get_index('Location')
+    locations = [location for location in remove_ignore_entities(popular_locations(), 'Location')
+                 if index.is_term(location)]
+    meals = remove_ignore_entities(list(get_index('Meal').main_terms), 'Meal')
+    report = prefetch_menus(locations, meals, [datetime.date.today()])
+    report['hosts'] = sorted(http.stats())
+    return report
+
+def report_warmup(report):
+    """Sends what each warmup step primed and why failed steps failed to Stackdriver.
+
+    :param report: Full warmup report from `warmup.Warmup.report`
+    :type report: dict
+    """
+    for step in report['steps']:
+        if not step['ok']:
+            report_error('warmup_error: %s failed after %.1f ms: %s' % (step['name'], step['ms'], step['error']))
+    primed = {step['name']: step.get('primed') for step in report['steps'] if step['ok']}
+    event_log.log('warmup: finished in %.1f ms, %s' % (report['ms'], json.dumps(primed, default=str)),
+                  message_type='warmup')
+
+warmup.reporter = report_warmup
+
+#App Engine warmup request handler
+@app.route('/_ah/warmup')
+def warmup_get():
+    """App Engine warmup request handler, called before a new instance receives traffic.
+       Builds the entity indexes, loads the secrets, opens the Datastore, Dashbot and
+       MDining connections and prefetches today's menus of the most popular locations.
+       Returns whether each step succeeded, details go to `report_warmup`. Steps run once per instance.
+    """
+    return jsonify(warmup.run())
@@ -0,0 +1,169 @@
+"""Bounded TTL + LRU cache for MDining API menu responses.
+
+Entries are keyed by (location, date, meal). Menus for today expire sooner than
+menus for other dates, and the least recently used entries are evicted once the
+cache grows past its byte budget. An expired entry is kept for ``stale_ttl``
+more seconds so that it can still be served while it is being refreshed, or
+while the MDining API is unavailable.
+"""
+import datetime
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_TODAY_TTL = 15 * 60
+DEFAULT_FUTURE_TTL = 6 * 60 * 60
+DEFAULT_STALE_TTL = 24 * 60 * 60
+
+
+def make_key(loc_in, date_in, meal_in=''):
+    """Builds a normalized cache key for a menu request.
+
+    :param loc_in: Input location
+    :type loc_in: string
+    :param date_in: Input date
+    :type date_in: string
+    :param meal_in: Input meal, empty string for a whole day
+    :type meal_in: string
+    """
+    return (loc_in.strip().casefold(), str(date_in)[:10], meal_in.strip().casefold())
+
+
+class MenuCache:
+    """Thread-safe LRU cache whose entries each carry their own expiry time.
+
+    :param max_bytes: Approximate memory cap, measured in response body bytes
+    :type max_bytes: int
+    :param max_entries: Maximum number of cached menus
+    :type max_entries: int
+    :param today_ttl: Seconds to keep a menu for today's date
+    :type today_ttl: int
+    :param future_ttl: Seconds to keep a menu for any other date
+    :type future_ttl: int
+    :param stale_ttl: Seconds an expired menu can still be served stale
+    :type stale_ttl: int
+    :param clock: Function returning the current time in seconds
+    :type clock: function
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES,
+                 today_ttl=DEFAULT_TODAY_TTL, future_ttl=DEFAULT_FUTURE_TTL,
+                 stale_ttl=DEFAULT_STALE_TTL, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.today_ttl = today_ttl
+        self.future_ttl = future_ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'expirations': 0, 'evictions': 0}
+
+    def ttl_for(self, key):
+        """Returns the time to live for a key based on its date.
+        """
+        if key[1] == datetime.date.today().isoformat():
+            return self.today_ttl
+        return self.future_ttl
+
+    def get(self, key):
+        """Returns the cached value for ``key`` or None if missing or expired.
+        """
+        value, fresh = self.lookup(key, allow_stale=False)
+        return value
+
+    def lookup(self, key, allow_stale=True):
+        """Returns ``(value, fresh)`` for ``key``. ``value`` is None if the key is
+           missing or past its stale window, and ``fresh`` is False for an expired value.
+
+        :param allow_stale: Return expired values still within the stale window
+        :type allow_stale: boolean
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return None, False
+            value, size, expires = entry
+            now = self.clock()
+            if expires > now:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return value, True
+            if expires + self.stale_ttl <= now:
+                self._remove(key)
+                self._counters['expirations'] += 1
+                self._counters['misses'] += 1
+                return None, False
+            if not allow_stale:
+                self._counters['misses'] += 1
+                return None, False
+            self._entries.move_to_end(key)
+            self._counters['stale_hits'] += 1
+            return value, False
+
+    def put(self, key, value, size, ttl=None):
+        """Stores ``value`` under ``key`` and evicts least recently used entries
+        until the cache is back under its limits.
+
+        :param size: Approximate size of the value in bytes
+        :type size: int
+        :param ttl: Seconds to keep the entry, defaults to `ttl_for`
+        :type ttl: int
+        """
+        if ttl is None:
+            ttl = self.ttl_for(key)
+        if size > self.max_bytes or ttl <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, self.clock() + ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._counters['evictions'] += 1
+
+    def invalidate(self, key):
+        """Removes ``key`` from the cache if present.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        """Removes every entry from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Returns hit ratio, eviction and size counters.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        value, size, expires = self._entries.pop(key)
+        self._bytes -= size
+
+
+menu_cache = MenuCache(
+    max_bytes=int(os.environ.get('MENU_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+    max_entries=int(os.environ.get('MENU_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+    today_ttl=int(os.environ.get('MENU_CACHE_TODAY_TTL', DEFAULT_TODAY_TTL)),
+    future_ttl=int(os.environ.get('MENU_CACHE_FUTURE_TTL', DEFAULT_FUTURE_TTL)),
+    stale_ttl=int(os.environ.get('MENU_CACHE_STALE_TTL', DEFAULT_STALE_TTL)))
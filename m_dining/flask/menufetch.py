@@ -0,0 +1,194 @@
+"""Menu fetching with stale-while-revalidate and a circuit breaker around the MDining API.
+
+A fresh cached menu is returned directly. An expired menu still within the
+cache's stale window is returned immediately while a background worker fetches
+a new copy. Only a menu that isn't cached at all makes the request wait on the
+MDining API, and when the circuit breaker is open it fails fast with
+`MenuUnavailable` instead. Concurrent requests for the same menu share one
+upstream call: the first caller fetches and the others wait for its result.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from circuitbreaker import CircuitBreaker, DEFAULT_FAILURE_THRESHOLD, DEFAULT_SLOW_CALL_SECONDS, DEFAULT_RESET_TIMEOUT
+from eventlog import event_log
+from httpclient import http
+from menucache import menu_cache
+from menuindex import ParsedMenu
+from menustream import parse_menu_stream, DEFAULT_CHUNK_SIZE
+from metrics import span
+
+DEFAULT_REFRESH_WORKERS = 2
+
+
+class MenuUnavailable(Exception):
+    """Raised when a menu isn't cached and the MDining API can't provide it.
+    """
+
+
+class Flight:
+    """One in-flight upstream fetch, shared by every caller asking for the same key.
+    """
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MenuFetcher:
+    """Serves menus from the cache, refreshing stale ones in the background.
+
+    :param cache: Cache of parsed menus
+    :type cache: menucache.MenuCache
+    :param breaker: Circuit breaker guarding the MDining API
+    :type breaker: circuitbreaker.CircuitBreaker
+    :param client: HTTP client used for MDining API calls
+    :type client: httpclient.HttpClient
+    :param refresh_workers: Maximum number of concurrent background refreshes
+    :type refresh_workers: int
+    """
+    def __init__(self, cache, breaker, client, refresh_workers=DEFAULT_REFRESH_WORKERS):
+        self.cache = cache
+        self.breaker = breaker
+        self.client = client
+        self.refresh_workers = refresh_workers
+        self._executor = None
+        self._refreshing = set()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._counters = {'fetches': 0, 'fetch_failures': 0, 'coalesced': 0, 'stale_served': 0,
+                          'refreshes': 0, 'refresh_failures': 0, 'short_circuits': 0}
+
+    def fetch(self, url, key):
+        """Returns the `menuindex.ParsedMenu` for ``key``, fetching ``url`` if it isn't cached.
+
+        :param url: Complete MDining API url for the request
+        :type url: string
+        :param key: Cache key from `menucache.make_key`
+        :type key: tuple
+        """
+        menu, fresh = self.cache.lookup(key)
+        if fresh:
+            return menu
+        if menu is not None:
+            self._count('stale_served')
+            self._schedule_refresh(url, key)
+            return menu
+
+        with span('mdining_fetch'):
+            return self._load_shared(url, key)
+
+    def reload(self, url, key):
+        """Fetches ``url`` into the cache even if ``key`` is cached and fresh,
+           sharing a fetch of the same key already in flight.
+        """
+        return self._load_shared(url, key)
+
+    def stats(self):
+        """Returns fetch, stale-serve and refresh counters.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['refreshing'] = len(self._refreshing)
+            stats['in_flight'] = len(self._flights)
+        return stats
+
+    def _load_shared(self, url, key):
+        """Fetches a menu, or waits for the fetch of the same key already in flight.
+           Raises `MenuUnavailable` to every caller if the fetch fails or the circuit is open.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+            else:
+                self._counters['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise MenuUnavailable(str(flight.error))
+            return flight.result
+
+        try:
+            if not self.breaker.allow():
+                self._count('short_circuits')
+                raise MenuUnavailable('MDining API circuit open')
+            self._count('fetches')
+            try:
+                flight.result = self._load(url, key)
+            except Exception as error:
+                self._count('fetch_failures')
+                event_log.log('mdining_error: %s %r' % (url, error), message_type='mdining_error')
+                raise MenuUnavailable(repr(error)) from error
+        except MenuUnavailable as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def _load(self, url, key):
+        """Fetches and caches a menu, parsing the response body as it streams in,
+           and reports the outcome to the circuit breaker.
+        """
+        start = time.perf_counter()
+        try:
+            response = self.client.get(url, stream=True)
+            try:
+                response.raise_for_status()
+                #The body shares the request's deadline
+                chunks = self.client.iter_body(response, self.client.deadline - (time.perf_counter() - start),
+                                               DEFAULT_CHUNK_SIZE)
+                menu, size = parse_menu_stream(chunks)
+            finally:
+                response.close()
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success(time.perf_counter() - start)
+        menu = ParsedMenu(menu)
+        self.cache.put(key, menu, size)
+        return menu
+
+    def _schedule_refresh(self, url, key):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.refresh_workers,
+                                                    thread_name_prefix='menu-refresh')
+        self._executor.submit(self._refresh, url, key)
+
+    def _refresh(self, url, key):
+        try:
+            self._load_shared(url, key)
+            self._count('refreshes')
+        except MenuUnavailable:
+            self._count('refresh_failures')
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+
+breaker = CircuitBreaker(
+    'mdining',
+    failure_threshold=int(os.environ.get('MDINING_BREAKER_FAILURES', DEFAULT_FAILURE_THRESHOLD)),
+    slow_call_seconds=float(os.environ.get('MDINING_BREAKER_SLOW_SECONDS', DEFAULT_SLOW_CALL_SECONDS)),
+    reset_timeout=float(os.environ.get('MDINING_BREAKER_RESET', DEFAULT_RESET_TIMEOUT)))
+
+fetcher = MenuFetcher(
+    menu_cache, breaker, http,
+    refresh_workers=int(os.environ.get('MENU_REFRESH_WORKERS', DEFAULT_REFRESH_WORKERS)))
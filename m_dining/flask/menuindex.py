@@ -0,0 +1,166 @@
+"""Per-menu index of normalized food item names.
+
+A fetched MDining menu is parsed into a `menumodel.Menu` and wrapped in a
+`ParsedMenu`, which builds a `MenuItemIndex` the first time an item lookup
+needs it. The index is cached together with the menu, so repeat ``findItem``
+questions about a location probe the index instead of walking the menu: whole
+words of a question are looked up in a token map, and only a question without
+whole-word hits falls back to a substring scan. The results of the most recent
+substring scans are remembered in a small LRU, so an index never grows with the
+number of queries it has answered.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from menumodel import Menu, Meal
+
+TOKEN_SPLIT = re.compile(r'[^\w]+')
+
+DEFAULT_MAX_SEARCHES = 32
+
+
+class MenuEntry:
+    """One food item of a menu with its meal, course and trait/allergen masks.
+    """
+    __slots__ = ('key', 'name', 'meal', 'course', 'item', 'traits', 'allergens')
+
+    def __init__(self, name, meal, course, item):
+        self.key = name.casefold()
+        self.name = name
+        self.meal = meal
+        self.course = course
+        self.item = item
+        self.traits = item.traits
+        self.allergens = item.allergens
+
+
+class MenuItemIndex:
+    """Normalized item names of a menu, in menu order, with token and substring lookup.
+
+    :param menu: Parsed menu
+    :type menu: menumodel.Menu
+    :param max_searches: Number of recent search results remembered
+    :type max_searches: int
+    """
+    __slots__ = ('entries', 'max_searches', '_named', '_tokens', '_searches', '_lock')
+
+    def __init__(self, menu, max_searches=DEFAULT_MAX_SEARCHES):
+        entries = []
+        for meal in menu.meals:
+            for course in meal.courses:
+                for item in course.items:
+                    name = item.name
+                    if name[-1:] == ' ':
+                        name = name[:-1]
+                    entries.append(MenuEntry(name, meal.name, course.name, item))
+        self.entries = tuple(entries)
+
+        #Only items of named courses are searchable
+        self._named = tuple(position for position, entry in enumerate(self.entries)
+                            if entry.course is not None)
+        tokens = {}
+        for position in self._named:
+            for token in set(filter(None, TOKEN_SPLIT.split(self.entries[position].key))):
+                tokens.setdefault(token, []).append(position)
+        self._tokens = {token: tuple(positions) for token, positions in tokens.items()}
+        self.max_searches = max_searches
+        self._searches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def search(self, item_in, meal_in=''):
+        """Returns entries whose name contains ``item_in``, optionally limited to one meal.
+
+        :param item_in: User input food item
+        :type item_in: string
+        :param meal_in: Name of meal, empty string for all meals
+        :type meal_in: string
+        """
+        query = item_in.casefold()
+        with self._lock:
+            positions = self._searches.get(query)
+            if positions is not None:
+                self._searches.move_to_end(query)
+        if positions is None:
+            positions = tuple(position for position in self._named
+                              if query in self.entries[position].key)
+            with self._lock:
+                self._searches[query] = positions
+                while len(self._searches) > self.max_searches:
+                    self._searches.popitem(last=False)
+        return self._select(positions, meal_in)
+
+    def find_tokens(self, item_in, meal_in=''):
+        """Returns entries containing every word of ``item_in`` as a whole word,
+           optionally limited to one meal, by probing the token map.
+
+        :param item_in: User input food item
+        :type item_in: string
+        :param meal_in: Name of meal, empty string for all meals
+        :type meal_in: string
+        """
+        words = set(filter(None, TOKEN_SPLIT.split(item_in.casefold())))
+        if not words:
+            return []
+        postings = sorted((self._tokens.get(word, ()) for word in words), key=len)
+        positions = set(postings[0])
+        for posting in postings[1:]:
+            positions.intersection_update(posting)
+        return self._select(sorted(positions), meal_in)
+
+    def lookup(self, item_in, meal_in=''):
+        """Returns entries matching ``item_in`` by whole words, or by substring if no
+           entry contains all of its words, optionally limited to one meal.
+        """
+        return self.find_tokens(item_in, meal_in) or self.search(item_in, meal_in)
+
+    def _select(self, positions, meal_in):
+        entries = [self.entries[position] for position in positions]
+        if meal_in:
+            meal = meal_in.casefold()
+            entries = [entry for entry in entries if entry.meal.casefold() == meal]
+        return entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ParsedMenu:
+    """Parsed menu together with its lazily built item index and meal views.
+
+    :param menu: Parsed menu
+    :type menu: menumodel.Menu
+    """
+    __slots__ = ('menu', '_items', '_meals')
+
+    def __init__(self, menu):
+        self.menu = menu
+        self._items = None
+        self._meals = {}
+
+    def meal(self, meal_in):
+        """Returns the `ParsedMenu` of one meal of this whole-day menu, in the shape the
+           API returns for a single-meal (``&meal=``) request. Built once per meal.
+
+        :param meal_in: Name of meal
+        :type meal_in: string
+        """
+        key = meal_in.upper()
+        menu = self._meals.get(key)
+        if menu is None:
+            #The API answers an unknown meal with its name and no courses
+            selected = Meal(key, (), False)
+            for meal in self.menu.meals:
+                if meal.name.upper() == key:
+                    selected = meal
+                    break
+            menu = self._meals[key] = ParsedMenu(Menu(self.menu.name, self.menu.date, (selected,)))
+        return menu
+
+    @property
+    def items(self):
+        """The `MenuItemIndex` of this menu, built on first access.
+        """
+        if self._items is None:
+            self._items = MenuItemIndex(self.menu)
+        return self._items
@@ -0,0 +1,98 @@
+"""Compact typed model of MDining API menus.
+
+`parse_menu` turns an API response into `Menu` -> `Meal` -> `Course` -> `Item`
+objects with ``__slots__``. Names are interned, trait and allergen lists are
+compiled to bit masks, and every field the API sends either as a single dict
+or as a list becomes a tuple. Code reading a menu never checks shapes, and a
+cached menu holds no raw JSON.
+"""
+import sys
+
+from traits import item_masks
+
+
+def as_list(value):
+    """Returns ``value`` as a list, wrapping a single dict from the API.
+    """
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def intern_name(value):
+    """Interns a name so that repeated names across menus share one string.
+    """
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+class Item:
+    """A food item with its trait and allergen masks from `traits`.
+    """
+    __slots__ = ('name', 'traits', 'allergens')
+
+    def __init__(self, name, traits, allergens):
+        self.name = name
+        self.traits = traits
+        self.allergens = allergens
+
+
+class Course:
+    """A course of a meal, ``name`` is None for unnamed courses.
+    """
+    __slots__ = ('name', 'items')
+
+    def __init__(self, name, items):
+        self.name = name
+        self.items = items
+
+
+class Meal:
+    """A meal of a day, ``has_courses`` is False if the API sent no courses for it.
+    """
+    __slots__ = ('name', 'courses', 'has_courses')
+
+    def __init__(self, name, courses, has_courses):
+        self.name = name
+        self.courses = courses
+        self.has_courses = has_courses
+
+
+class Menu:
+    """A location's menu for a date.
+    """
+    __slots__ = ('name', 'date', 'meals')
+
+    def __init__(self, name, date, meals):
+        self.name = name
+        self.date = date
+        self.meals = meals
+
+
+def parse_item(data):
+    return Item(intern_name(data['name']), *item_masks(data))
+
+
+def parse_course(data):
+    return Course(intern_name(data.get('name')),
+                  tuple(parse_item(item) for item in as_list(data.get('menuitem'))))
+
+
+def parse_meal(data):
+    return Meal(intern_name(data.get('name', '')),
+                tuple(parse_course(course) for course in as_list(data.get('course'))),
+                'course' in data)
+
+
+def parse_menu(data):
+    """Returns the `Menu` of an MDining API response.
+
+    :param data: MDining API HTTP response data
+    :type data: dict
+    """
+    menu = data.get('menu') or {}
+    return Menu(intern_name(menu.get('name')), menu.get('date'),
+                tuple(parse_meal(meal) for meal in as_list(menu.get('meal'))))
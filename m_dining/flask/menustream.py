@@ -0,0 +1,206 @@
+"""Incremental parsing of MDining API responses into the `menumodel` classes.
+
+`iter_meals` reads a response body chunk by chunk and yields each
+`menumodel.Meal` as soon as its JSON object is complete. A small scanner walks
+the menu/meal skeleton, and each course is decoded by the C JSON decoder as soon
+as it is fully buffered. The response is never held whole, either as text or as
+a dict tree. `parse_menu_stream` builds a `menumodel.Menu` from a stream and can
+stop reading as soon as a requested meal is complete.
+"""
+import codecs
+import json
+
+from menumodel import Menu, Meal, intern_name, parse_course, parse_meal
+
+DEFAULT_CHUNK_SIZE = 16 * 1024
+
+WHITESPACE = ' \t\n\r'
+
+_decoder = json.JSONDecoder()
+
+
+class StreamError(ValueError):
+    """Raised when a streamed response isn't the JSON structure expected.
+    """
+
+
+class JsonStream:
+    """Buffered reader of a JSON text arriving as chunks of UTF-8 bytes.
+
+    :param chunks: Iterable of byte strings (e.g. ``response.iter_content(...)``)
+    :type chunks: iterable
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decode = codecs.getincrementaldecoder('utf-8')().decode
+        self.buffer = ''
+        self.pos = 0
+        self.bytes_read = 0
+        self.exhausted = False
+
+    def fill(self):
+        """Appends the next chunk to the buffer, dropping consumed text.
+           Returns False once the stream is exhausted.
+        """
+        if self.exhausted:
+            return False
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            self.bytes_read += len(chunk)
+            self.buffer = self.buffer[self.pos:] + self._decode(chunk)
+            self.pos = 0
+            return True
+        self.exhausted = True
+        tail = self._decode(b'', True)
+        if tail:
+            self.buffer = self.buffer[self.pos:] + tail
+            self.pos = 0
+            return True
+        return False
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it, '' at the end.
+        """
+        while True:
+            buffer = self.buffer
+            pos = self.pos
+            while pos < len(buffer) and buffer[pos] in WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < len(buffer):
+                return buffer[pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise StreamError('Expected %r after %d bytes' % (char, self.bytes_read))
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next complete JSON value, reading more chunks until it is buffered.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            #A number ending the buffer may continue in the next chunk
+            if (end == len(self.buffer) and isinstance(value, (int, float))
+                    and not isinstance(value, bool) and self.fill()):
+                continue
+            self.pos = end
+            return value
+
+    def members(self):
+        """Yields the keys of the next object. The caller consumes each member's value.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise StreamError('Expected , or } after %d bytes' % self.bytes_read)
+
+    def elements(self):
+        """Yields once per element of the next array. The caller consumes each element.
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise StreamError('Expected , or ] after %d bytes' % self.bytes_read)
+
+
+def read_meal(stream):
+    """Reads one meal object from the stream, decoding its courses one at a time.
+    """
+    if stream.peek() != '{':
+        return parse_meal(stream.value())
+    name = ''
+    courses = []
+    has_courses = False
+    for key in stream.members():
+        if key == 'name':
+            name = stream.value()
+        elif key == 'course':
+            has_courses = True
+            if stream.peek() == '[':
+                for _ in stream.elements():
+                    courses.append(parse_course(stream.value()))
+            else:
+                course = stream.value()
+                if course is not None:
+                    courses.append(parse_course(course))
+        else:
+            stream.value()
+    return Meal(intern_name(name), tuple(courses), has_courses)
+
+
+def iter_meals(stream, header):
+    """Yields each meal of a streamed API response as soon as it is complete.
+
+    :param stream: Stream positioned at the start of the response
+    :type stream: JsonStream
+    :param header: Dict that receives the menu's ``name`` and ``date`` as they are read
+    :type header: dict
+    """
+    for key in stream.members():
+        if key != 'menu' or stream.peek() != '{':
+            stream.value()
+            continue
+        for menu_key in stream.members():
+            if menu_key == 'meal':
+                char = stream.peek()
+                if char == '[':
+                    for _ in stream.elements():
+                        yield read_meal(stream)
+                elif char == '{':
+                    yield read_meal(stream)
+                else:
+                    stream.value()
+            elif menu_key in ('name', 'date'):
+                header[menu_key] = stream.value()
+            else:
+                stream.value()
+
+
+def parse_menu_stream(chunks, meal_in=None):
+    """Builds the `menumodel.Menu` of an API response arriving in chunks,
+       returns (menu, bytes read).
+
+    :param chunks: Iterable of byte strings of the response body
+    :type chunks: iterable
+    :param meal_in: Stop reading once this meal is complete; the menu then holds the
+                    meals read so far. None to read the whole response.
+    :type meal_in: string
+    """
+    stream = JsonStream(chunks)
+    header = {}
+    meals = []
+    target = meal_in.upper() if meal_in else None
+    for meal in iter_meals(stream, header):
+        meals.append(meal)
+        if target is not None and isinstance(meal.name, str) and meal.name.upper() == target:
+            break
+    menu = Menu(intern_name(header.get('name')), header.get('date'), tuple(meals))
+    return menu, stream.bytes_read
@@ -0,0 +1,172 @@
+"""Per-request timing spans and Prometheus text metrics for the webhook.
+
+`trace_request` starts a trace for one webhook call and `span` times a stage
+within it. Both feed latency histograms labelled by intent, and a request
+slower than ``SLOW_REQUEST_MS`` is logged with its full span breakdown.
+Subsystem counters (menu cache, HTTP client, ...) are exported as gauges.
+"""
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from eventlog import event_log
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))
+
+_current = contextvars.ContextVar('mvoice_trace', default=None)
+
+
+def escape(value):
+    """Escapes a label value for the Prometheus text format.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (name, escape(value)) for name, value in labels) + '}'
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with labels.
+
+    :param name: Metric name
+    :type name: string
+    :param help_text: Metric description
+    :type help_text: string
+    :param labelnames: Names of the labels, in order
+    :type labelnames: tuple
+    """
+    def __init__(self, name, help_text, labelnames, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help_text), '# TYPE %s histogram' % self.name]
+        with self._lock:
+            series = sorted((labels, list(counts), total, count)
+                            for labels, (counts, total, count) in self._series.items())
+        for labelvalues, counts, total, count in series:
+            labels = list(zip(self.labelnames, labelvalues))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append('%s_bucket%s %d' % (self.name, format_labels(labels + [('le', repr(bound))]),
+                                                 bucket_count))
+            lines.append('%s_bucket%s %d' % (self.name, format_labels(labels + [('le', '+Inf')]), count))
+            lines.append('%s_sum%s %r' % (self.name, format_labels(labels), total))
+            lines.append('%s_count%s %d' % (self.name, format_labels(labels), count))
+        return lines
+
+
+REQUEST_SECONDS = Histogram('mvoice_request_seconds',
+                            'Webhook request latency by intent.', ('intent',))
+STAGE_SECONDS = Histogram('mvoice_stage_seconds',
+                          'Webhook stage latency by intent and stage.', ('intent', 'stage'))
+
+_stats_sources = []
+
+
+def register_stats(prefix, stats_function, label=None):
+    """Exports the numeric values of a subsystem ``stats()`` dict as gauges.
+
+    :param prefix: Metric name prefix (e.g. 'menu_cache')
+    :type prefix: string
+    :param stats_function: Callable returning a flat dict of counters, or with
+                           ``label`` set, a dict of label value -> dict of counters
+    :type stats_function: function
+    :param label: Label name for the outer keys of a nested stats dict
+    :type label: string
+    """
+    _stats_sources.append((prefix, stats_function, label))
+
+
+def render_stats():
+    samples = {}
+    for prefix, stats_function, label in _stats_sources:
+        stats = stats_function()
+        rows = stats.items() if label else [(None, stats)]
+        for labelvalue, values in rows:
+            labels = [(label, labelvalue)] if label else []
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = 'mvoice_%s_%s' % (prefix, key)
+                samples.setdefault(name, []).append('%s%s %r' % (name, format_labels(labels), value))
+    lines = []
+    for name in sorted(samples):
+        lines.append('# TYPE %s gauge' % name)
+        lines.extend(samples[name])
+    return lines
+
+
+def render():
+    """Returns every metric in the Prometheus text exposition format.
+    """
+    lines = REQUEST_SECONDS.render() + STAGE_SECONDS.render() + render_stats()
+    return '\n'.join(lines) + '\n'
+
+
+class Trace:
+    """Spans recorded for one webhook request.
+    """
+    __slots__ = ('intent', 'start', 'spans')
+
+    def __init__(self, intent):
+        self.intent = intent
+        self.start = time.perf_counter()
+        self.spans = []
+
+
+@contextmanager
+def trace_request(intent='unknown'):
+    """Traces one webhook request; set ``trace.intent`` once the intent is known.
+    """
+    trace = Trace(intent)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        elapsed = time.perf_counter() - trace.start
+        REQUEST_SECONDS.observe(elapsed, trace.intent)
+        if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+            breakdown = ' '.join('%s=%.1fms' % (name, 1000 * seconds) for name, seconds in trace.spans)
+            event_log.log('slow_request: %s %.1fms %s' % (trace.intent, elapsed * 1000, breakdown),
+                          message_type='slow_request')
+
+
+@contextmanager
+def span(stage):
+    """Times a stage of the current request. Does nothing outside `trace_request`.
+    """
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        trace.spans.append((stage, elapsed))
+        STAGE_SECONDS.observe(elapsed, trace.intent, stage)
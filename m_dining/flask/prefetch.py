@@ -0,0 +1,99 @@
+"""Scheduled menu prefetch that warms the menu cache for every location.
+
+Each location's whole-day menu is fetched once per date through the menu
+fetcher, the same cache entry both intents answer from, and the views of its
+meals used by ``findLocationAndMeal`` are built ahead of time. Instance warmup
+prefetches today's menus of the most popular locations the same way.
+"""
+import datetime
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from datahandle import day_menu_url
+from menucache import make_key
+from menufetch import fetcher
+
+DEFAULT_WORKERS = 8
+
+#Busiest residential dining halls, prefetched by instance warmup
+DEFAULT_POPULAR_LOCATIONS = ('Mosher Jordan Dining Hall', 'South Quad Dining Hall', 'East Quad Dining Hall',
+                             'North Quad Dining Hall', 'Markley Dining Hall', 'Bursley Dining Hall',
+                             'Twigs at Oxford')
+
+
+def prefetch_location(loc_in, date_in, meals):
+    """Fetches and caches one location's menus for a date,
+       returns a report entry for the location.
+
+    :param loc_in: Location name
+    :type loc_in: string
+    :param date_in: Date of the menu
+    :type date_in: string
+    :param meals: Case-folded names of meals to build views of
+    :type meals: set
+    """
+    start = time.monotonic()
+    report = {'location': loc_in, 'date': str(date_in)}
+    try:
+        menu = fetcher.reload(day_menu_url(loc_in, date_in), make_key(loc_in, date_in))
+
+        prepared_meals = []
+        for meal in menu.menu.meals:
+            if meal.name.casefold() not in meals:
+                continue
+            menu.meal(meal.name)
+            prepared_meals.append(meal.name)
+        report['meals'] = prepared_meals
+        report['ok'] = True
+    except Exception as error:
+        report['ok'] = False
+        report['error'] = repr(error)
+    report['ms'] = round(1000 * (time.monotonic() - start), 1)
+    return report
+
+
+def prefetch_menus(locations, meals, dates, workers=None):
+    """Warms the menu cache for every location on every date with a bounded
+       worker pool, returns a summary with per-location timings.
+
+    :param locations: Location names to fetch
+    :type locations: list
+    :param meals: Meal names to cache individually
+    :type meals: list
+    :param dates: Dates to fetch
+    :type dates: list
+    :param workers: Maximum number of concurrent fetches
+    :type workers: int
+    """
+    if workers is None:
+        workers = int(os.environ.get('PREFETCH_WORKERS', DEFAULT_WORKERS))
+    meals = set(meal.casefold() for meal in meals)
+    jobs = [(loc_in, date_in) for date_in in dates for loc_in in locations]
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda job: prefetch_location(job[0], job[1], meals), jobs))
+
+    failed = [result for result in results if not result['ok']]
+    return {'fetched': len(results) - len(failed),
+            'failed': len(failed),
+            'ms': round(1000 * (time.monotonic() - start), 1),
+            'results': results}
+
+
+def popular_locations():
+    """Returns the locations to prefetch when an instance starts, from the
+       comma-separated ``WARMUP_LOCATIONS`` or the default list of busiest dining halls.
+    """
+    locations = os.environ.get('WARMUP_LOCATIONS')
+    if locations is None:
+        return list(DEFAULT_POPULAR_LOCATIONS)
+    return [location.strip() for location in locations.split(',') if location.strip()]
+
+
+def default_dates():
+    """Returns today's and tomorrow's dates.
+    """
+    today = datetime.date.today()
+    return [today, today + datetime.timedelta(days=1)]
@@ -0,0 +1 @@
+../../common/secretstore.py
\ No newline at end of file
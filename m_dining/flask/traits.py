@@ -0,0 +1,110 @@
+"""Bitmask encoding of item traits and allergens.
+
+Every trait and allergen name is interned into a bit the first time it is seen,
+either from the known vocabulary below or from a parsed menu. Items and user
+requisites are both compiled to integer masks so that checking an item is two
+AND operations.
+"""
+import threading
+
+#Spoken names of API requisite values, also used to seed the vocabularies
+DISPLAY_NAMES = {'trait': {'mhealthy': 'healthy'},
+                 'allergens': {'sesame-seed': 'sesame seeds',
+                               'tree-nuts': 'tree nuts',
+                               'wheat_barley_rye': 'wheat or barley or rye'}}
+
+
+class Vocabulary:
+    """Thread-safe mapping of names to single-bit integer flags.
+
+    :param names: Names to intern up front
+    :type names: iterable
+    """
+    def __init__(self, names=()):
+        self._bits = {}
+        self._lock = threading.Lock()
+        for name in names:
+            self.bit(name)
+
+    def bit(self, name):
+        """Returns the bit for ``name``, interning it if new.
+        """
+        bit = self._bits.get(name)
+        if bit is None:
+            with self._lock:
+                bit = self._bits.get(name)
+                if bit is None:
+                    bit = self._bits[name] = 1 << len(self._bits)
+        return bit
+
+    def mask(self, names):
+        """Returns the OR of the bits of every name in ``names``.
+        """
+        mask = 0
+        for name in names:
+            mask |= self.bit(name)
+        return mask
+
+    def names(self, mask):
+        """Returns the names whose bits are set in ``mask``.
+        """
+        return [name for name, bit in self._bits.items() if mask & bit]
+
+    def __len__(self):
+        return len(self._bits)
+
+
+TRAITS = Vocabulary(DISPLAY_NAMES['trait'])
+ALLERGENS = Vocabulary(DISPLAY_NAMES['allergens'])
+
+
+def as_names(value):
+    """Returns the names in an API trait/allergen field (dict, list or single string).
+    """
+    if not value:
+        return ()
+    if isinstance(value, str):
+        return (value,)
+    return value
+
+
+def item_masks(item):
+    """Returns the (trait mask, allergen mask) of an MDining API food item.
+
+    :param item: Data of specific food item
+    :type item: dict
+    """
+    return TRAITS.mask(as_names(item.get('trait'))), ALLERGENS.mask(as_names(item.get('allergens')))
+
+
+def compile_requisites(requisites):
+    """Returns the (trait mask, allergen mask) of user requisites.
+
+    :param requisites: Contains information food item must comply with (traits, allergens, etc)
+    :type requisites: dict
+    """
+    return TRAITS.mask(requisites['trait']), ALLERGENS.mask(requisites['allergens'])
+
+
+def requisite_masks(requisites):
+    """Returns the compiled masks stored in ``requisites['masks']``,
+       compiling and storing them first if missing.
+
+    :param requisites: Contains information food item must comply with (traits, allergens, etc)
+    :type requisites: dict
+    """
+    masks = requisites.get('masks')
+    if masks is None:
+        masks = requisites['masks'] = compile_requisites(requisites)
+    return masks
+
+
+def satisfies(trait_mask, allergen_mask, masks):
+    """Returns True if an item with the given masks has every required trait
+       and none of the excluded allergens.
+
+    :param masks: Compiled (trait mask, allergen mask) of the requisites
+    :type masks: tuple
+    """
+    required_traits, excluded_allergens = masks
+    return (trait_mask & required_traits) == required_traits and not allergen_mask & excluded_allergens
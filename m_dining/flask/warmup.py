@@ -0,0 +1 @@
+../../common/warmup.py
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""Tests that the async serving mode keeps the event loop free while requests
+wait on blocking calls such as the first Datastore secrets load.
+
+Run from the repository root with ``python -m pytest m_dining/tests``.
+"""
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(TESTS_DIR, '..', 'flask'), os.path.join(TESTS_DIR, '..', 'bench')]
+
+import fakes
+
+fakes.install()
+
+import asyncmain
+import metrics
+import secretstore
+from asyncserve import AsyncApp, requires_auth
+
+AUTHORIZATION = 'Basic ' + base64.b64encode(b'bench:bench').decode()
+
+
+async def call(app, method, path, body=b'', headers=()):
+    """Sends one request to an ASGI app, returns (status, body, time.monotonic() when answered).
+    """
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+             'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]['status'], messages[1]['body'], time.monotonic()
+
+
+def run(*coroutines):
+    """Runs coroutines concurrently on a new event loop, returns their results
+       and the time.monotonic() they were started at.
+    """
+    async def gather():
+        return await asyncio.gather(*coroutines)
+
+    loop = asyncio.new_event_loop()
+    start = time.monotonic()
+    try:
+        return start, loop.run_until_complete(gather())
+    finally:
+        loop.close()
+
+
+def traced_requests():
+    """Returns the number of webhook requests recorded in the latency histogram.
+    """
+    return sum(series[2] for series in metrics.REQUEST_SECONDS._series.values())
+
+
+class TestRequiresAuth(unittest.TestCase):
+
+    def test_slow_check_leaves_loop_free(self):
+        def slow_check(header):
+            time.sleep(0.5)
+            return header == 'ok'
+
+        @requires_auth(slow_check)
+        async def slow(request):
+            return {'slow': True}
+
+        async def fast(request):
+            return {'fast': True}
+
+        app = AsyncApp(None, {('GET', '/slow'): slow, ('GET', '/fast'): fast})
+        start, ((slow_status, _, slow_done), (fast_status, _, fast_done)) = run(
+            call(app, 'GET', '/slow', headers=[('Authorization', 'ok')]),
+            call(app, 'GET', '/fast'))
+
+        self.assertEqual((slow_status, fast_status), (200, 200))
+        self.assertGreaterEqual(slow_done - start, 0.5)
+        self.assertLess(fast_done - start, 0.2)
+
+    def test_rejected_check_is_401(self):
+        @requires_auth(lambda header: False)
+        async def handler(request):
+            return {}
+
+        app = AsyncApp(None, {('GET', '/'): handler})
+        _, ((status, body, _),) = run(call(app, 'GET', '/'))
+        self.assertEqual(status, 401)
+
+
+class TestAsyncWebhook(unittest.TestCase):
+
+    def setUp(self):
+        self.original_provider = secretstore.provider
+        secretstore.provider = secretstore.SecretsProvider(fakes.FakeDatastore(latency=0.5))
+
+    def tearDown(self):
+        secretstore.provider.stop()
+        secretstore.provider = self.original_provider
+
+    def test_slow_secrets_load_does_not_block_second_request(self):
+        payload = json.dumps(fakes.load_fixture('webhook', 'queryHelper.json')).encode('utf-8')
+        headers = [('Authorization', AUTHORIZATION), ('Content-Type', 'application/json')]
+        start, ((webhook_status, _, webhook_done), (home_status, home_body, home_done)) = run(
+            call(asyncmain.app, 'POST', '/webhook', payload, headers),
+            call(asyncmain.app, 'GET', '/'))
+
+        self.assertEqual((webhook_status, home_status), (200, 200))
+        self.assertEqual(home_body, b'Success')
+        self.assertGreaterEqual(webhook_done - start, 0.5)
+        self.assertLess(home_done - start, 0.2)
+
+    def test_rejected_request_is_not_traced(self):
+        before = traced_requests()
+        payload = json.dumps(fakes.load_fixture('webhook', 'queryHelper.json')).encode('utf-8')
+        _, ((status, _, _),) = run(call(asyncmain.app, 'POST', '/webhook', payload))
+
+        self.assertEqual(status, 401)
+        self.assertEqual(traced_requests(), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
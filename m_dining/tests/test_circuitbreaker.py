@@ -0,0 +1,105 @@
+"""Tests for the circuit breaker's state transitions, driven by a fake clock.
+"""
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(TESTS_DIR, '..', 'flask'), os.path.join(TESTS_DIR, '..', 'bench')]
+
+import fakes
+
+fakes.install()
+
+from circuitbreaker import CircuitBreaker, CLOSED, HALF_OPEN, OPEN
+
+
+class FakeClock:
+    """Clock that only moves when told to.
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker('test', failure_threshold=3, slow_call_seconds=1.0,
+                                      reset_timeout=30, clock=self.clock)
+
+    def trip(self):
+        for _ in range(3):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success(0.1)
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CLOSED)
+
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.stats()['short_circuits'], 1)
+
+    def test_slow_calls_count_as_failures(self):
+        for _ in range(3):
+            self.breaker.record_success(1.5)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.stats()['slow_calls'], 3)
+
+    def test_half_open_after_reset_timeout_allows_one_trial(self):
+        self.trip()
+        self.clock.advance(29.9)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.state, OPEN)
+
+        self.clock.advance(0.1)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_successful_trial_closes(self):
+        self.trip()
+        self.clock.advance(30)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success(0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.stats()['consecutive_failures'], 0)
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_trial_reopens_for_another_reset_timeout(self):
+        self.trip()
+        self.clock.advance(30)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, OPEN)
+
+        self.clock.advance(29)
+        self.assertFalse(self.breaker.allow())
+        self.clock.advance(1)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+
+    def test_transitions_are_counted(self):
+        self.trip()
+        self.clock.advance(30)
+        self.breaker.allow()
+        self.breaker.record_success(0.1)
+        stats = self.breaker.stats()
+        self.assertEqual((stats['opened'], stats['transitions'], stats['state_code']), (1, 3, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
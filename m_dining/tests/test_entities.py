@@ -0,0 +1,67 @@
+"""Tests that entity validation and "Did you mean" suggestions ignore case and
+surrounding or repeated whitespace in the user's input.
+"""
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(TESTS_DIR, '..', 'flask'), os.path.join(TESTS_DIR, '..', 'bench')]
+
+import fakes
+
+fakes.install()
+
+import fuzzy
+import main
+from entities import EntityIndex, get_index, normalize
+
+
+class TestNormalize(unittest.TestCase):
+
+    def test_collapses_whitespace_and_case(self):
+        self.assertEqual(normalize('  North\tQuad  Dining\nHall '), 'north quad dining hall')
+        self.assertEqual(normalize('   '), '')
+
+
+class TestEntityIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = EntityIndex(['North Quad Dining Hall', 'Mosher Jordan Dining Hall'],
+                                 ['North Quad', 'Dining Hall'], ['NQ '])
+
+    def test_lookups_ignore_case_and_whitespace(self):
+        for search in ('north quad dining hall', ' NORTH QUAD DINING HALL', 'North  Quad Dining Hall\t'):
+            self.assertTrue(self.index.is_term(search), search)
+            self.assertTrue(self.index.is_known(search), search)
+        self.assertTrue(self.index.is_known(' nq'))
+        self.assertTrue(self.index.is_partial('north  quad '))
+        self.assertFalse(self.index.is_partial('north'))
+
+    def test_suggestions_ignore_case_and_whitespace(self):
+        self.assertEqual(self.index.suggestions(' Dining   HALL'),
+                         ('North Quad Dining Hall', 'Mosher Jordan Dining Hall'))
+        self.assertEqual(self.index.suggestions('north quad '), ('North Quad Dining Hall',))
+
+
+class TestSimilarSearch(unittest.TestCase):
+
+    def test_known_terms_with_stray_whitespace_are_found(self):
+        for search in ('lunch', 'lunch ', ' LUNCH', 'Lunch\n'):
+            self.assertEqual(main.similar_search(search, 'Meal'), 'Found', repr(search))
+        for search in ('Mosher Jordan Dining Hall', ' mosher  jordan dining hall '):
+            self.assertEqual(main.similar_search(search, 'Location'), 'Found', repr(search))
+
+    def test_partial_and_misspelled_terms_suggest_the_same_names(self):
+        self.assertEqual(main.similar_search('North  QUAD ', 'Location'),
+                         main.similar_search('north quad', 'Location'))
+        self.assertEqual(fuzzy.suggest('  Mosher  JORDN', 'Location'), fuzzy.suggest('mosher jordn', 'Location'))
+        self.assertTrue(main.similar_search(' mosher jordn ', 'Location').startswith('Did you mean '))
+
+    def test_index_has_every_category(self):
+        self.assertGreater(len(get_index('Location')), 0)
+        self.assertGreater(len(get_index('meal')), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""Tests that a streamed response body shares the deadline of its call.
+"""
+import os
+import sys
+import time
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(TESTS_DIR, '..', 'flask'), os.path.join(TESTS_DIR, '..', 'bench')]
+
+import requests
+from requests.adapters import BaseAdapter
+
+from httpclient import HttpClient
+
+
+class DripBody:
+    """Raw response body returning one chunk per read after ``delay`` seconds.
+    """
+    def __init__(self, chunks, delay):
+        self.chunks = list(chunks)
+        self.delay = delay
+
+    def read(self, amount=None):
+        if not self.chunks:
+            return b''
+        time.sleep(self.delay)
+        return self.chunks.pop(0)
+
+    def close(self):
+        pass
+
+
+class DripAdapter(BaseAdapter):
+    """Transport adapter answering every request with a `DripBody`.
+    """
+    def __init__(self, chunks, delay):
+        super().__init__()
+        self.chunks = chunks
+        self.delay = delay
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = DripBody(self.chunks, self.delay)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class TestIterBody(unittest.TestCase):
+
+    def client(self, chunks, delay):
+        client = HttpClient(deadline=1.0)
+        client.session.mount('http://', DripAdapter(chunks, delay))
+        return client
+
+    def test_body_read_within_deadline(self):
+        client = self.client([b'{"a":', b' 1}'], 0.01)
+        response = client.get('http://api.test/menu', stream=True)
+        self.assertEqual(b''.join(client.iter_body(response, 1.0, 16)), b'{"a": 1}')
+        self.assertEqual(client.stats()['api.test']['body_timeouts'], 0)
+
+    def test_trickling_body_is_cut_off_at_deadline(self):
+        client = self.client([b'x'] * 50, 0.05)
+        response = client.get('http://api.test/menu', stream=True)
+        start = time.monotonic()
+        chunks = []
+        with self.assertRaises(requests.Timeout):
+            for chunk in client.iter_body(response, 0.3, 16):
+                chunks.append(chunk)
+        self.assertLess(time.monotonic() - start, 0.3 + 0.15)
+        self.assertLess(len(chunks), 50)
+        self.assertEqual(client.stats()['api.test']['body_timeouts'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
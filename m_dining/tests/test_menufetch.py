@@ -0,0 +1,156 @@
+"""Tests for serving menus from the cache while they are refreshed from the MDining API,
+and for sharing one upstream fetch between concurrent callers.
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(TESTS_DIR, '..', 'flask'), os.path.join(TESTS_DIR, '..', 'bench')]
+
+import fakes
+
+fakes.install()
+
+from circuitbreaker import CircuitBreaker
+from httpclient import HttpClient
+from menucache import MenuCache
+from menufetch import MenuFetcher, MenuUnavailable
+
+KEY = ('mosher jordan dining hall', '2019-11-12', '')
+URL = 'http://api.test/menu?location=Mosher+Jordan+Dining+Hall'
+
+
+class FakeClock:
+    """Clock that only moves when told to.
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_for(condition, timeout=2.0):
+    """Waits until ``condition()`` is true, failing the test after ``timeout`` seconds.
+    """
+    expires = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > expires:
+            raise AssertionError('condition not met within %.1fs' % timeout)
+        time.sleep(0.005)
+
+
+class FetcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = MenuCache(today_ttl=60, future_ttl=60, stale_ttl=600, clock=self.clock)
+        self.fetcher = MenuFetcher(self.cache, CircuitBreaker('test'), HttpClient())
+        self.loads = []
+        self.release = threading.Event()
+        patcher = mock.patch.object(self.fetcher, '_load', side_effect=self.load)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.release.set)
+
+    def load(self, url, key):
+        """Stands in for the upstream fetch: blocks until released, then caches a new menu.
+        """
+        self.loads.append(key)
+        self.release.wait()
+        menu = 'menu %d' % len(self.loads)
+        self.cache.put(key, menu, 1)
+        return menu
+
+
+class TestStaleServing(FetcherTestCase):
+
+    def test_stale_menu_served_while_one_refresh_runs(self):
+        self.cache.put(KEY, 'old menu', 1)
+        self.clock.now += 61
+
+        served = [self.fetcher.fetch(URL, KEY) for _ in range(5)]
+        self.assertEqual(served, ['old menu'] * 5)
+        wait_for(lambda: self.loads)
+        self.assertEqual(self.loads, [KEY])
+        self.assertEqual(self.fetcher.stats()['refreshing'], 1)
+
+        self.release.set()
+        wait_for(lambda: self.fetcher.stats()['refreshing'] == 0)
+        self.assertEqual(self.fetcher.fetch(URL, KEY), 'menu 1')
+        self.assertEqual(len(self.loads), 1)
+        stats = self.fetcher.stats()
+        self.assertEqual((stats['stale_served'], stats['refreshes'], stats['fetches']), (5, 1, 1))
+
+    def test_fresh_menu_is_not_refreshed(self):
+        self.cache.put(KEY, 'menu', 1)
+        self.clock.now += 59
+        self.assertEqual(self.fetcher.fetch(URL, KEY), 'menu')
+        self.assertEqual(self.loads, [])
+        self.assertEqual(self.fetcher.stats()['refreshing'], 0)
+
+    def test_menu_past_stale_window_is_fetched(self):
+        self.cache.put(KEY, 'old menu', 1)
+        self.clock.now += 60 + 600
+        self.release.set()
+        self.assertEqual(self.fetcher.fetch(URL, KEY), 'menu 1')
+        self.assertEqual(self.fetcher.stats()['stale_served'], 0)
+
+
+class TestCoalescing(FetcherTestCase):
+
+    CALLERS = 8
+
+    def fetch_concurrently(self):
+        """Fetches ``KEY`` from ``CALLERS`` threads once they all wait on the same fetch,
+           returns each caller's menu or raised error.
+        """
+        outcomes = [None] * self.CALLERS
+
+        def call(position):
+            try:
+                outcomes[position] = self.fetcher.fetch(URL, KEY)
+            except Exception as error:
+                outcomes[position] = error
+
+        threads = [threading.Thread(target=call, args=(position,)) for position in range(self.CALLERS)]
+        for thread in threads:
+            thread.start()
+        wait_for(lambda: self.fetcher.stats()['coalesced'] == self.CALLERS - 1)
+        self.release.set()
+        for thread in threads:
+            thread.join(2.0)
+        return outcomes
+
+    def test_concurrent_callers_share_one_fetch(self):
+        outcomes = self.fetch_concurrently()
+        self.assertEqual(self.loads, [KEY])
+        self.assertEqual(outcomes, ['menu 1'] * self.CALLERS)
+        self.assertEqual(self.fetcher.stats()['in_flight'], 0)
+
+    def test_error_reaches_every_waiter(self):
+        def failing_load(url, key):
+            self.loads.append(key)
+            self.release.wait()
+            raise ConnectionError('MDining API down')
+
+        self.fetcher._load.side_effect = failing_load
+        outcomes = self.fetch_concurrently()
+        self.assertEqual(self.loads, [KEY])
+        for outcome in outcomes:
+            self.assertIsInstance(outcome, MenuUnavailable)
+            self.assertIn('MDining API down', str(outcome))
+        stats = self.fetcher.stats()
+        self.assertEqual((stats['fetch_failures'], stats['in_flight']), (1, 0))
+
+        #The failed fetch is not remembered: the next caller fetches again
+        self.fetcher._load.side_effect = self.load
+        self.assertEqual(self.fetcher.fetch(URL, KEY), 'menu 2')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Tests for the per-menu item index and the ``findItem`` lookup that uses it.
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(TESTS_DIR, '..', 'flask'), os.path.join(TESTS_DIR, '..', 'bench')]
+
+import fakes
+
+fakes.install()
+
+import datahandle
+from menuindex import MenuItemIndex, ParsedMenu
+from menumodel import Course, Item, Meal, Menu
+
+
+def make_menu():
+    def course(name, *items):
+        return Course(name, tuple(Item(item, 0, 0) for item in items))
+
+    return Menu('Test Dining Hall', '2019-11-12', (
+        Meal('LUNCH', (course('Entrees', 'Fried Chicken', 'Chickpea Curry', 'Grilled Cheese '),
+                       course(None, 'Unlisted Chicken')), True),
+        Meal('DINNER', (course('Grill', 'Chicken Tenders', 'Chicken, Fried'),), True),
+    ))
+
+
+class TestMenuItemIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = MenuItemIndex(make_menu())
+
+    def names(self, entries):
+        return [entry.name for entry in entries]
+
+    def test_find_tokens_matches_whole_words_in_menu_order(self):
+        self.assertEqual(self.names(self.index.find_tokens('chicken')),
+                         ['Fried Chicken', 'Chicken Tenders', 'Chicken, Fried'])
+
+    def test_find_tokens_requires_every_word(self):
+        self.assertEqual(self.names(self.index.find_tokens('Fried  CHICKEN')),
+                         ['Fried Chicken', 'Chicken, Fried'])
+        self.assertEqual(self.index.find_tokens('fried tofu'), [])
+
+    def test_find_tokens_limited_to_meal(self):
+        self.assertEqual(self.names(self.index.find_tokens('chicken', 'dinner')),
+                         ['Chicken Tenders', 'Chicken, Fried'])
+
+    def test_unnamed_courses_are_not_searchable(self):
+        self.assertNotIn('Unlisted Chicken', self.names(self.index.lookup('chicken')))
+        self.assertEqual(self.index.lookup('unlisted'), [])
+
+    def test_lookup_probes_tokens_before_scanning(self):
+        with mock.patch.object(MenuItemIndex, 'search') as search:
+            entries = self.index.lookup('cheese')
+        self.assertEqual(self.names(entries), ['Grilled Cheese'])
+        search.assert_not_called()
+
+    def test_lookup_falls_back_to_substring(self):
+        self.assertEqual(self.names(self.index.lookup('chick')),
+                         ['Fried Chicken', 'Chickpea Curry', 'Chicken Tenders', 'Chicken, Fried'])
+
+    def test_search_memo_is_bounded(self):
+        index = MenuItemIndex(make_menu(), max_searches=4)
+        for number in range(20):
+            index.search('query %d' % number)
+        self.assertEqual(len(index._searches), 4)
+
+
+class TestRequestItem(unittest.TestCase):
+
+    def request(self, item_in, meal_in=''):
+        with mock.patch.object(datahandle, 'fetch_menu', return_value=ParsedMenu(make_menu())):
+            return datahandle.request_item('2019-11-12', 'Test Dining Hall', item_in, meal_in,
+                                           {'trait': [], 'allergens': []})['fulfillmentText']
+
+    def test_whole_word_hits_skip_the_substring_scan(self):
+        with mock.patch.object(MenuItemIndex, 'search', side_effect=AssertionError('scanned')):
+            text = self.request('tenders')
+        self.assertEqual(text, 'Yes, there is  Chicken Tenders during DINNER')
+
+    def test_partial_word_falls_back_to_substring(self):
+        self.assertEqual(self.request('chickp'), 'Yes, there is  Chickpea Curry during LUNCH')
+
+    def test_missing_item(self):
+        self.assertEqual(self.request('tofu'), 'Sorry, that is not available')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""Tests that the streaming parser builds the same menus as `menumodel.parse_menu`
+wherever the response body is split into chunks.
+"""
+import json
+import os
+import random
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(TESTS_DIR, '..', 'flask'), os.path.join(TESTS_DIR, '..', 'bench')]
+
+import fakes
+
+fakes.install()
+
+import menusynth
+from menumodel import parse_menu
+from menustream import StreamError, parse_menu_stream
+
+CHUNK_SIZES = (1, 2, 3, 7, 64, 16 * 1024)
+
+
+def as_tuple(menu):
+    """Returns a menu as nested tuples of plain values, for comparison.
+    """
+    return (menu.name, menu.date,
+            tuple((meal.name, meal.has_courses,
+                   tuple((course.name,
+                          tuple((item.name, item.traits, item.allergens) for item in course.items))
+                         for course in meal.courses))
+                  for meal in menu.meals))
+
+
+def split(body, size):
+    return [body[start:start + size] for start in range(0, len(body), size)]
+
+
+def random_split(body, rng):
+    chunks = []
+    start = 0
+    while start < len(body):
+        end = start + rng.randint(1, 40)
+        chunks.append(body[start:end])
+        start = end
+    return chunks
+
+
+def shapes():
+    """Returns (description, response data) pairs covering the shapes the API sends.
+    """
+    item = {'name': 'Crème Brûlée 🍮', 'trait': {'vegetarian': {'name': 'vegetarian'}},
+            'allergens': {'milk': {'name': 'milk'}, 'eggs': {'name': 'eggs'}}}
+    return [
+        ('fixture day', fakes.load_fixture('mdining', 'menu_day.json')),
+        ('single meal and course dicts', {'menu': {'name': 'Bursley', 'date': '2019-11-12',
+                                                   'meal': {'name': 'LUNCH', 'course': {
+                                                       'name': 'Desserts', 'menuitem': item}}}}),
+        ('meal without courses', {'menu': {'meal': [{'name': 'BREAKFAST'}, {'name': 'LUNCH', 'course': None},
+                                                    {'name': 'DINNER', 'course': []}]}}),
+        ('numbers and extra keys', {'status': 200, 'menu': {'date': '2019-11-12', 'meal': [
+            {'name': 'DINNER', 'sort': 123456789, 'course': [{'name': 'Grill', 'id': 1.25e-3,
+                                                              'menuitem': [item, {'name': 'Fries', 'kcal': 40}]}]}],
+            'name': 'East Quad', 'open': True}}),
+        ('no menu', {'status': 'closed', 'menu': None}),
+        ('empty menu', {'menu': {}}),
+    ] + [('synthetic day %d' % seed, menusynth.make_day('Location %d' % seed, '2019-11-12',
+                                                        courses=3, items=4, seed=seed))
+         for seed in range(3)]
+
+
+class TestParseMenuStream(unittest.TestCase):
+
+    def test_matches_parse_menu_for_every_chunking(self):
+        rng = random.Random(23)
+        for description, data in shapes():
+            expected = as_tuple(parse_menu(data))
+            for indent in (None, 2):
+                body = json.dumps(data, indent=indent, ensure_ascii=False).encode('utf-8')
+                chunkings = [split(body, size) for size in CHUNK_SIZES] + [random_split(body, rng)
+                                                                          for _ in range(5)]
+                for chunks in chunkings:
+                    menu, size = parse_menu_stream(chunks)
+                    self.assertEqual(as_tuple(menu), expected, (description, indent, len(chunks)))
+                    self.assertEqual(size, len(body))
+
+    def test_stops_after_requested_meal(self):
+        data = menusynth.make_day('Bursley', '2019-11-12', meals=3, seed=7)
+        meals = parse_menu(data).meals
+        body = json.dumps(data).encode('utf-8')
+        for position, meal in enumerate(meals):
+            for size in (1, 64):
+                menu, read = parse_menu_stream(split(body, size), meal.name.lower())
+                self.assertEqual(as_tuple(menu)[2], as_tuple(parse_menu(data))[2][:position + 1])
+                if position < len(meals) - 1:
+                    self.assertLess(read, len(body))
+
+    def test_malformed_body_raises(self):
+        for body in (b'{"menu": {"meal": [{"name": "LUNCH"}', b'[1, 2]', b'{"menu": {"meal": [{"name" "x"}]}}'):
+            for size in (1, 64):
+                with self.assertRaises(ValueError):
+                    parse_menu_stream(split(body, size))
+        self.assertTrue(issubclass(StreamError, ValueError))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Tests that the unauthenticated warmup route only reports step names and status,
+while what the steps primed and why they failed go to the reporter.
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(TESTS_DIR, '..', 'flask'), os.path.join(TESTS_DIR, '..', 'bench')]
+
+import fakes
+
+fakes.install()
+
+import main
+from warmup import Warmup
+
+
+def make_warmup(reporter):
+    warmup = Warmup(reporter)
+
+    @warmup.step('secrets')
+    def warm_secrets():
+        return {'keys': 7}
+
+    @warmup.step('menus')
+    def warm_menus():
+        raise RuntimeError('connect to http://10.0.0.5:8080 refused')
+
+    return warmup
+
+
+class TestWarmup(unittest.TestCase):
+
+    def test_run_returns_only_names_and_status(self):
+        reports = []
+        warmup = make_warmup(reports.append)
+        expected = {'ok': False, 'steps': [{'name': 'secrets', 'ok': True}, {'name': 'menus', 'ok': False}]}
+        self.assertEqual(warmup.run(), expected)
+        self.assertEqual(warmup.run(), expected)
+
+        self.assertEqual(len(reports), 1)
+        secrets, menus = reports[0]['steps']
+        self.assertEqual(secrets['primed'], {'keys': 7})
+        self.assertIn('10.0.0.5', menus['error'])
+        self.assertEqual(warmup.stats()['failed_steps'], 1)
+
+    def test_failing_reporter_does_not_fail_warmup(self):
+        warmup = make_warmup(mock.Mock(side_effect=ValueError('reporter down')))
+        self.assertFalse(warmup.run()['ok'])
+        self.assertEqual(warmup.reporter.call_count, 1)
+
+
+class TestWarmupRoute(unittest.TestCase):
+
+    def test_details_go_to_the_event_log(self):
+        client = main.app.test_client()
+        with mock.patch.object(main, 'warmup', make_warmup(main.report_warmup)), \
+                mock.patch.object(main, 'report_error') as report_error, \
+                mock.patch.object(main.event_log, 'log') as log:
+            response = client.get('/_ah/warmup')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'ok': False, 'steps': [{'name': 'secrets', 'ok': True},
+                                                                      {'name': 'menus', 'ok': False}]})
+        self.assertNotIn(b'10.0.0.5', response.get_data())
+        report_error.assert_called_once()
+        self.assertIn('10.0.0.5', report_error.call_args[0][0])
+        self.assertTrue(report_error.call_args[0][0].startswith('warmup_error: menus failed'))
+        self.assertIn('"keys": 7', log.call_args[0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
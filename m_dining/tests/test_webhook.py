@@ -0,0 +1,66 @@
+"""Tests for the authentication of the m_dining webhook and cron routes.
+"""
+import base64
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(TESTS_DIR, '..', 'flask'), os.path.join(TESTS_DIR, '..', 'bench')]
+
+import fakes
+
+fakes.install()
+
+import main
+import metrics
+
+AUTHORIZATION = 'Basic ' + base64.b64encode(b'bench:bench').decode()
+
+
+def traced_requests():
+    """Returns the number of webhook requests recorded in the latency histogram.
+    """
+    return sum(series[2] for series in metrics.REQUEST_SECONDS._series.values())
+
+
+class TestWebhookAuth(unittest.TestCase):
+
+    def setUp(self):
+        self.client = main.app.test_client()
+        self.payload = fakes.load_fixture('webhook', 'findLocationAndMeal.json')
+
+    def test_rejected_requests_are_not_traced(self):
+        before = traced_requests()
+        for headers in ({}, {'Authorization': 'Basic ' + base64.b64encode(b'bench:wrong').decode()}):
+            response = self.client.post('/webhook', json=self.payload, headers=headers)
+            self.assertEqual(response.status_code, 401)
+        self.assertEqual(traced_requests(), before)
+
+    def test_authenticated_requests_are_traced(self):
+        before = traced_requests()
+        response = self.client.post('/webhook', json=self.payload, headers={'Authorization': AUTHORIZATION})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(traced_requests(), before + 1)
+
+
+class TestCronAuth(unittest.TestCase):
+
+    def setUp(self):
+        self.client = main.app.test_client()
+
+    def test_rejected_credentials_are_401(self):
+        for path in ('/cron', '/cron/prefetch'):
+            for payload in ({'user': 'bench', 'pass': 'wrong'}, {}, None):
+                response = self.client.post(path, json=payload)
+                self.assertEqual(response.status_code, 401, (path, payload))
+                self.assertEqual(response.get_json(), {'message': 'Authentication failed.'})
+
+    def test_update_reports_differences(self):
+        response = self.client.post('/cron', json={'user': 'bench', 'pass': 'bench'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue({'message', 'locationadded', 'mealadded', 'notified', 'timing'} <= set(response.get_json()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+"""Asyncio serving mode of the m_proxy service, run with ``uvicorn asyncmain:app``.
+
+``POST /proxy`` and ``POST /proxy/batch`` are answered by coroutines that await
+the Dialogflow calls on the blocking-call pool. A batch awaits its queries
+concurrently, up to its concurrency limit. Every other route, including CORS
+preflight requests, is served by the Flask app in `main`.
+"""
+import asyncio
+
+from asyncserve import AsyncApp, requires_auth, run_blocking
+from auth import authenticator
+from main import app as flask_app, answer_query, answer_batch_item, batch_request
+
+def cors_headers(request):
+    """Returns the CORS headers flask-cors adds to the Flask responses,
+       which allow any origin by echoing the request's Origin.
+    """
+    origin = request.headers.get('origin')
+    if origin is None:
+        return []
+    return [('Access-Control-Allow-Origin', origin), ('Vary', 'Origin')]
+
+
+@requires_auth(authenticator.check_authorization)
+async def proxy(request):
+    """Async proxy to DialogFlow, answers exactly like `main.proxy_post`.
+    """
+    req_data = request.get_json()
+
+    project = req_data['project'] #project id
+    user_query = req_data['user_query'] #user question
+
+    return await run_blocking(answer_query, project, user_query, req_data.get('session_id'))
+
+
+@requires_auth(authenticator.check_authorization)
+async def proxy_batch(request):
+    """Async batch proxy to DialogFlow, answers exactly like `main.proxy_batch_post`.
+    """
+    project, queries, concurrency = batch_request(request.get_json())
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(query):
+        async with semaphore:
+            return await run_blocking(answer_batch_item, project, query)
+
+    results = await asyncio.gather(*[run(query) for query in queries])
+    return {'results': list(results)}
+
+
+app = AsyncApp(flask_app, {('POST', '/proxy'): proxy,
+                           ('POST', '/proxy/batch'): proxy_batch},
+               response_headers=cors_headers)
@@ -0,0 +1,171 @@
+"""Process-wide Dialogflow sessions client.
+
+Keeps one ``SessionsClient`` (and its gRPC channel) warm for the life of the
+process, applies a deadline to every detect-intent call, rebuilds the client
+when the channel breaks, and records detect-intent latency percentiles.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+DEFAULT_DEADLINE = 4.0
+DEFAULT_WINDOW = 1000
+
+
+def sessions_client():
+    """Builds a ``SessionsClient``, importing the Dialogflow library on first use.
+    """
+    import dialogflow_v2
+    return dialogflow_v2.SessionsClient()
+
+
+def reconnect_errors():
+    """Returns the errors that indicate a broken channel rather than a bad request.
+       Only ``UNAVAILABLE`` qualifies: the query never reached Dialogflow, so it is
+       safe to send again. Detect-intent calls advance the session's contexts and
+       can trigger fulfillment, so errors such as ``UNKNOWN`` are not retried.
+    """
+    from google.api_core import exceptions
+    return (exceptions.ServiceUnavailable,)
+
+
+def close_client(client):
+    """Closes the gRPC channel of a discarded ``SessionsClient``.
+    """
+    transport = getattr(client, 'transport', None)
+    close = getattr(transport, 'close', None) or getattr(getattr(transport, 'channel', None), 'close', None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception:
+        pass
+
+
+def percentile(ordered, fraction):
+    """Returns the nearest-rank percentile of an already sorted list.
+
+    :param ordered: Sorted values
+    :type ordered: list
+    :param fraction: Percentile between 0 and 1 (e.g. 0.95)
+    :type fraction: float
+    """
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+class DialogflowSessions:
+    """Shared Dialogflow client with deadlines, reconnects and latency tracking.
+
+    :param deadline: Seconds allowed for each detect-intent call
+    :type deadline: float
+    :param window: Number of recent calls kept for latency percentiles
+    :type window: int
+    :param client_factory: Callable returning a new ``SessionsClient``
+    :type client_factory: function
+    """
+    def __init__(self, deadline=DEFAULT_DEADLINE, window=DEFAULT_WINDOW,
+                 client_factory=sessions_client):
+        self.deadline = deadline
+        self.client_factory = client_factory
+        self._client = None
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._counters = {'calls': 0, 'errors': 0, 'reconnects': 0}
+
+    @property
+    def client(self):
+        """The shared ``SessionsClient``, created on first use.
+        """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self.client_factory()
+        return self._client
+
+    def connect(self, timeout=DEFAULT_DEADLINE):
+        """Creates the shared client and waits up to ``timeout`` seconds for its gRPC
+           channel to connect. Returns True once the channel is ready, False if it
+           didn't connect in time or the client exposes no channel.
+        """
+        import grpc
+        channel = getattr(getattr(self.client, 'transport', None), 'channel', None)
+        if channel is None:
+            return False
+        try:
+            grpc.channel_ready_future(channel).result(timeout=timeout)
+        except grpc.FutureTimeoutError:
+            return False
+        return True
+
+    def reconnect(self, client=None):
+        """Discards the current client and closes its channel, so the next call opens
+           a new one. When ``client`` is given, does nothing if another caller already
+           replaced that client.
+        """
+        with self._lock:
+            if self._client is None or (client is not None and self._client is not client):
+                return
+            client, self._client = self._client, None
+            self._counters['reconnects'] += 1
+        close_client(client)
+
+    def detect_intent(self, project, session_id, user_query, language_code='en-US'):
+        """Sends one text query to Dialogflow and returns the ``DetectIntentResponse``.
+        Retries once on a fresh channel if the current one is unavailable.
+
+        :param project: Dialogflow project id
+        :type project: string
+        :param session_id: Dialogflow session id
+        :type session_id: string
+        :param user_query: User question
+        :type user_query: string
+        """
+        query_input = {
+            "text": {
+                "text": user_query,
+                "language_code": language_code
+            }
+        }
+        for attempt in range(2):
+            client = self.client
+            session = client.session_path(project, session_id)
+            start = time.monotonic()
+            try:
+                response = client.detect_intent(session, query_input, timeout=self.deadline)
+            except reconnect_errors():
+                self._record(time.monotonic() - start, error=True)
+                if attempt:
+                    raise
+                self.reconnect(client)
+            except Exception:
+                self._record(time.monotonic() - start, error=True)
+                raise
+            else:
+                self._record(time.monotonic() - start, error=False)
+                return response
+
+    def stats(self):
+        """Returns call/error/reconnect counters and p50/p95/p99 latency in milliseconds.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            ordered = sorted(self._latencies)
+        for name, fraction in (('p50_ms', 0.50), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+            stats[name] = 1000 * percentile(ordered, fraction)
+        return stats
+
+    def _record(self, elapsed, error):
+        with self._lock:
+            self._counters['calls'] += 1
+            if error:
+                self._counters['errors'] += 1
+            self._latencies.append(elapsed)
+
+
+sessions = DialogflowSessions(
+    deadline=float(os.environ.get('DIALOGFLOW_DEADLINE', DEFAULT_DEADLINE)),
+    window=int(os.environ.get('DIALOGFLOW_LATENCY_WINDOW', DEFAULT_WINDOW)))
@@ -1,40 +1,22 @@
 from functools import wraps
 import datetime
-import json, requests
+import json
 from flask import Flask, request, jsonify, abort
 from flask_cors import CORS
-from google.cloud import datastore
-import dialogflow_v2
+import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dialogflowclient import sessions
+from auth import requires_auth
+from secretstore import provider as secrets_provider
+from warmup import warmup
 #import google.cloud.logging
 
 app = Flask(__name__)
 CORS(app)
 
-#TODO: Move this into a common library
-def get_secrets():
-    """Fetches secrets from Datastore and returns them as a list.
-    """
-    client = datastore.Client()
-    query = client.query(kind='env_vars')
-    entity = query.fetch()
-    secrets = list(entity)[0]
-    return secrets
-
-#Authentication
-def check_auth(name, passw):
-    secrets = get_secrets()
-    passwcheck = secrets.get('pass')
-    usercheck = secrets.get('user')
-    return name == usercheck and passw == passwcheck
-def requires_auth(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        auth = request.authorization
-        if not auth or not check_auth(auth.username, auth.password):
-            abort(401)
-        return f(*args, **kwargs)
-    return decorated
+BATCH_CONCURRENCY = int(os.environ.get('PROXY_BATCH_CONCURRENCY', 8))
+BATCH_MAX_QUERIES = int(os.environ.get('PROXY_BATCH_MAX_QUERIES', 100))
 
 #Basic homepage for checking successful deployment
 @app.route('/')
@@ -43,34 +25,138 @@ def home():
     """
     return "Success"
 
+def answer_query(project, user_query, session_id):
+    """Sends one query to Dialogflow and returns the proxy response data.
+
+    :param project: Dialogflow project id
+    :type project: string
+    :param user_query: User question
+    :type user_query: string
+    :param session_id: Session id, a new one is generated if empty
+    :type session_id: string
+    """
+    # Use the provided session_id if present and not empty
+    session_id = session_id or uuid.uuid1()
+
+    response = sessions.detect_intent(project, session_id, user_query) #response is returned as DetectIntentResponse class
+
+    return {'project': project,
+            'user_query': user_query,
+            'response': response.query_result.fulfillment_text,
+            'session_id': session_id}
+
+def answer_batch_item(project, query):
+    """Answers one query of a batch, returns an ``error`` entry instead of raising.
+
+    :param project: Dialogflow project id
+    :type project: string
+    :param query: ``{"user_query", "session_id"}`` object, ``session_id`` optional
+    :type query: dict
+    """
+    try:
+        return answer_query(project, query['user_query'], query.get('session_id'))
+    except Exception as error:
+        return {'project': project,
+                'user_query': query.get('user_query'),
+                'session_id': query.get('session_id'),
+                'error': str(error) or type(error).__name__}
+
+def batch_request(req_data):
+    """Validates a batch request and returns its (project, queries, concurrency limit).
+       Aborts with 400 and a message if it is malformed, and with 413 if it has too many queries.
+
+    :param req_data: Batch request data
+    :type req_data: dict
+    """
+    if not isinstance(req_data, dict):
+        abort(400, 'Expected a JSON object')
+    project = req_data.get('project')
+    if not isinstance(project, str) or not project:
+        abort(400, '"project" must be a non-empty string')
+
+    queries = req_data.get('queries')
+    if not isinstance(queries, list) or not queries:
+        abort(400, '"queries" must be a non-empty list')
+    if len(queries) > BATCH_MAX_QUERIES:
+        abort(413)
+    for position, query in enumerate(queries):
+        if not isinstance(query, dict) or not isinstance(query.get('user_query'), str):
+            abort(400, 'queries[%d] must be an object with a string "user_query"' % position)
+        if not isinstance(query.get('session_id') or '', str):
+            abort(400, 'queries[%d] "session_id" must be a string' % position)
+
+    concurrency = req_data.get('concurrency')
+    if concurrency is None:
+        concurrency = BATCH_CONCURRENCY
+    elif isinstance(concurrency, bool) or not isinstance(concurrency, int) or concurrency < 1:
+        abort(400, '"concurrency" must be a positive integer')
+    return project, queries, min(concurrency, BATCH_CONCURRENCY)
+
+#Request validation errors, answered as JSON like the async serving mode
+@app.errorhandler(400)
+def bad_request(error):
+    """Returns the message of a 400 error as JSON.
+    """
+    return jsonify(message=error.description), 400
+
 #Webhook call
 @app.route('/proxy', methods=['POST'])
 @requires_auth
 def proxy_post():
     """ Proxy to DialogFlow
     """
-    secrets = get_secrets()
     req_data = request.get_json()
 
     project = req_data['project'] #project id
     user_query = req_data['user_query'] #user question
-    
-    # Use the provided session_id if present and not empty
-    session_id = req_data.get('session_id', uuid.uuid1()) or uuid.uuid1()
-    
-    client = dialogflow_v2.SessionsClient()
-    session = client.session_path(project, session_id)
-    
-    query_input = {
-        "text": {
-            "text": user_query,
-            "language_code": "en-US"
-        }
-    }
-    response = client.detect_intent(session, query_input) #response is returned as DetectIntentResponse class
-    
-    responsedata = {'project': project,
-                    'user_query': user_query,
-                    'response': response.query_result.fulfillment_text,
-                    'session_id': session_id}
-    return jsonify(responsedata)
+
+    return jsonify(answer_query(project, user_query, req_data.get('session_id')))
+
+#Batch webhook call
+@app.route('/proxy/batch', methods=['POST'])
+@requires_auth
+def proxy_batch_post():
+    """ Proxy a list of queries to DialogFlow concurrently.
+        Expects ``project`` and ``queries``, a non-empty list of ``{"user_query", "session_id"}``
+        objects (``session_id`` optional), and an optional positive ``concurrency`` limit.
+        Returns results in request order, with an ``error`` entry for failed items,
+        or 400 with a ``message`` if the request is malformed.
+    """
+    project, queries, concurrency = batch_request(request.get_json())
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(queries))) as executor:
+        results = list(executor.map(lambda query: answer_batch_item(project, query), queries))
+
+    return jsonify(results=results)
+
+#Dialogflow client statistics
+@app.route('/stats')
+@requires_auth
+def stats_get():
+    """Dialogflow call, error and reconnect counters, detect-intent latency
+       percentiles in milliseconds and the instance warmup status, as JSON.
+       Requires authentication.
+    """
+    return jsonify(dialogflow=sessions.stats(), warmup=warmup.stats())
+
+#Instance warmup steps, run in order by `warmup_get`
+@warmup.step('secrets')
+def warm_secrets():
+    """Loads the secrets, which opens the shared Datastore client.
+    """
+    return {'keys': len(secrets_provider.get())}
+
+@warmup.step('dialogflow')
+def warm_dialogflow():
+    """Creates the shared Dialogflow client and opens its gRPC channel.
+    """
+    return {'connected': sessions.connect()}
+
+#App Engine warmup request handler
+@app.route('/_ah/warmup')
+def warmup_get():
+    """App Engine warmup request handler, called before a new instance receives traffic.
+       Loads the secrets and opens the Datastore and Dialogflow connections.
+       Returns whether each step succeeded, details are logged. Steps run once per instance.
+    """
+    return jsonify(warmup.run())
@@ -0,0 +1,136 @@
+"""Tests for the m_proxy Flask routes, with Dialogflow and Datastore replaced by fakes.
+
+Run from the repository root with ``python -m pytest m_proxy/tests``. The
+service's ``main`` is loaded as ``proxy_main`` so it does not collide with the
+m_dining ``main`` module.
+"""
+import base64
+import importlib.util
+import os
+import sys
+import time
+import unittest
+
+os.environ.setdefault('PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION', 'python')
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FLASK_DIR = os.path.join(TESTS_DIR, '..', 'flask')
+sys.path[:0] = [FLASK_DIR, os.path.join(TESTS_DIR, '..', '..', 'm_dining', 'bench')]
+
+import fakes
+import secretstore
+from google.api_core import exceptions
+
+secretstore.provider.loader = fakes.FakeDatastore()
+
+spec = importlib.util.spec_from_file_location('proxy_main', os.path.join(FLASK_DIR, 'main.py'))
+main = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(main)
+
+AUTHORIZATION = 'Basic ' + base64.b64encode(b'bench:bench').decode()
+
+
+class FakeSessionsClient:
+    """Dialogflow ``SessionsClient`` answering after ``latency`` seconds, or raising
+       the next error of ``errors``, a list shared by the clients of one test.
+    """
+    def __init__(self, latency=0.0, errors=None):
+        self.latency = latency
+        self.errors = [] if errors is None else errors
+
+    def session_path(self, project, session_id):
+        return 'projects/%s/agent/sessions/%s' % (project, session_id)
+
+    def detect_intent(self, session, query_input, timeout=None):
+        time.sleep(self.latency)
+        if self.errors:
+            raise self.errors.pop(0)
+        result = type('QueryResult', (), {'fulfillment_text': 'Answer to ' + query_input['text']['text']})
+        return type('DetectIntentResponse', (), {'query_result': result})
+
+
+class ProxyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.original_sessions = main.sessions
+        main.sessions = main.sessions.__class__(deadline=1.0, client_factory=self.client_factory)
+        self.client = main.app.test_client()
+
+    def tearDown(self):
+        main.sessions = self.original_sessions
+
+    def client_factory(self):
+        return FakeSessionsClient()
+
+    def post(self, path, payload, authorization=AUTHORIZATION):
+        return self.client.post(path, json=payload, headers={'Authorization': authorization})
+
+
+class TestStats(ProxyTestCase):
+
+    def setUp(self):
+        self.errors = [exceptions.ServiceUnavailable('down'), exceptions.ServiceUnavailable('still down')]
+        super().setUp()
+
+    def client_factory(self):
+        return FakeSessionsClient(latency=0.01, errors=self.errors)
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.client.get('/stats').status_code, 401)
+
+    def test_reports_dialogflow_counters_and_latency(self):
+        #First query fails, is retried once on a new channel and fails again; the second is answered
+        self.assertEqual(self.post('/proxy', {'project': 'p', 'user_query': 'a'}).status_code, 500)
+        response = self.post('/proxy', {'project': 'p', 'user_query': 'b', 'session_id': 's'})
+        self.assertEqual(response.get_json()['response'], 'Answer to b')
+
+        response = self.client.get('/stats', headers={'Authorization': AUTHORIZATION})
+        self.assertEqual(response.status_code, 200)
+        stats = response.get_json()
+        self.assertEqual({key: stats['dialogflow'][key] for key in ('calls', 'errors', 'reconnects')},
+                         {'calls': 3, 'errors': 2, 'reconnects': 1})
+        for name in ('p50_ms', 'p95_ms', 'p99_ms'):
+            self.assertGreaterEqual(stats['dialogflow'][name], 10)
+        self.assertIn('failed_steps', stats['warmup'])
+
+
+class TestBatchValidation(ProxyTestCase):
+
+    def assertRejected(self, payload, message):
+        response = self.post('/proxy/batch', payload)
+        self.assertEqual(response.status_code, 400, payload)
+        self.assertIn(message, response.get_json()['message'])
+
+    def test_malformed_queries_are_rejected(self):
+        for queries in (None, [], {}, 'what is for lunch'):
+            self.assertRejected({'project': 'p', 'queries': queries}, '"queries"')
+        for queries in (['what is for lunch'], [{'session_id': 's'}], [{'user_query': 5}],
+                        [{'user_query': 'a'}, None]):
+            self.assertRejected({'project': 'p', 'queries': queries}, 'must be an object')
+        self.assertRejected({'project': 'p', 'queries': [{'user_query': 'a', 'session_id': 7}]},
+                            '"session_id"')
+
+    def test_malformed_concurrency_is_rejected(self):
+        for concurrency in ('abc', [], 0, -2, 1.5, True):
+            self.assertRejected({'project': 'p', 'queries': [{'user_query': 'a'}], 'concurrency': concurrency},
+                                '"concurrency"')
+
+    def test_malformed_request_is_rejected(self):
+        self.assertRejected(['p'], 'JSON object')
+        self.assertRejected({'queries': [{'user_query': 'a'}]}, '"project"')
+
+    def test_too_many_queries(self):
+        payload = {'project': 'p', 'queries': [{'user_query': 'a'}] * (main.BATCH_MAX_QUERIES + 1)}
+        self.assertEqual(self.post('/proxy/batch', payload).status_code, 413)
+
+    def test_valid_batch_is_answered_in_order(self):
+        payload = {'project': 'p', 'concurrency': 2,
+                   'queries': [{'user_query': 'a', 'session_id': 's'}, {'user_query': 'b'}]}
+        response = self.post('/proxy/batch', payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['response'] for result in response.get_json()['results']],
+                         ['Answer to a', 'Answer to b'])
+
+
+if __name__ == '__main__':
+    unittest.main()